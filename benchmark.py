@@ -0,0 +1,286 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+from gridpathfinder import GridPathFinder
+from mazepathfinder import MazePathFinder
+from tiledmap import TiledPathFinder, saveTiled
+
+try:
+    import resource  # Peak RSS, not available on Windows
+except ImportError:
+    resource = None
+
+ENGINES = {'grid': GridPathFinder, 'maze': MazePathFinder}
+MODES = {'grid': ('astar', 'bidirectional', 'jps', 'weighted', 'alt'), 'maze': ('astar', 'bidirectional', 'weighted', 'alt')}
+COUNTERS = ('expanded', 'pushes', 'scanned')
+OPTIMAL_MODES = ('bidirectional', 'jps', 'alt')  # Checked against the cost of plain A* on every query
+
+
+def randomPathFinder(kind, size, density, rng):
+    if kind == 'grid':
+        structure = (rng.random((size, size)) < density).astype(np.uint8)
+    else:
+        # Each wall bit is set independently, bit 1 for a left wall and bit 2 for a top wall
+        structure = ((rng.random((size, size)) < density) * 1 + (rng.random((size, size)) < density) * 2).astype(np.uint8)
+    structure[0, 0] = structure[-1, -1] = 0
+    cls = GridPathFinder if kind == 'grid' else MazePathFinder
+    return cls.fromStructure(structure, (0, 0), (size - 1, size - 1))
+
+
+def benchmarkReplanning(kind='grid', size=256, density=0.2, changes=50, seed=0):
+    # Blocks one cell of the current path at a time and times the replanner's repair against a fresh A* search
+    rng = np.random.default_rng(seed)
+    pathFinder = randomPathFinder(kind, size, density, rng)
+    blocked = 1 if kind == 'grid' else 3
+    planner = pathFinder.replanner(pathFinder.start, pathFinder.end)
+
+    startTime = time.perf_counter()
+    path = planner.path()
+    initialTime = time.perf_counter() - startTime
+
+    replanTimes, searchTimes = [], []
+    for _ in range(changes):
+        if path is None or len(path) < 3:
+            break
+        pathFinder.setCell(path[rng.integers(1, len(path) - 1)], blocked)
+
+        startTime = time.perf_counter()
+        path = planner.path()
+        replanTimes.append(time.perf_counter() - startTime)
+
+        startTime = time.perf_counter()
+        fullPath = pathFinder.aStarSearch(pathFinder.start, pathFinder.end, pathFinder.structure)
+        searchTimes.append(time.perf_counter() - startTime)
+        if (path is None) != (fullPath is None) or (path is not None and len(path) != len(fullPath)):
+            raise AssertionError("Replanned path differs in length from a full search")
+
+    return {
+        'kind': kind,
+        'size': size,
+        'density': density,
+        'changes': len(replanTimes),
+        'initialPlan': initialTime,
+        'meanReplan': float(np.mean(replanTimes)) if replanTimes else None,
+        'meanFullSearch': float(np.mean(searchTimes)) if searchTimes else None,
+    }
+
+
+def generatedPathFinder(kind, size, level, seed):
+    # level is the obstacle density of a grid, or the braid of a maze (0 is a perfect maze)
+    if kind == 'grid':
+        return GridPathFinder((0, 0), (size - 1, size - 1), size, size, density=level, seed=seed)
+    return MazePathFinder((0, 0), (size - 1, size - 1), size, size, braid=level, seed=seed)
+
+
+def benchmarkQueries(pathFinder, count, rng):
+    # Corner to corner first, then random pairs of open cells
+    queries = [((0, 0), (pathFinder.height - 1, pathFinder.width - 1))]
+    openCells = np.flatnonzero(pathFinder.structure.ravel() == 0) if pathFinder.kind == 'grid' else None
+    while len(queries) < count:
+        if openCells is None:
+            cells = rng.integers(0, pathFinder.height * pathFinder.width, 2)
+        else:
+            cells = openCells[rng.integers(0, len(openCells), 2)]
+        queries.append(tuple(divmod(int(cell), pathFinder.width) for cell in cells))
+    return queries
+
+
+def benchmarkSearches(kind, size, level, mode, queries=5, seed=0, memory=True, repeats=3):
+    pathFinder = generatedPathFinder(kind, size, level, seed)
+    pathFinder.getMoves()  # Compile outside the timed searches
+    if mode == 'jps':
+        pathFinder.jumpTablesFor(pathFinder.structure)
+    rng = np.random.default_rng(seed)
+    result = {'kind': kind, 'size': size, 'level': level, 'mode': mode, 'seed': seed, 'repeats': repeats,
+              'queries': 0, 'found': 0, 'pathLength': 0, 'time': 0.0, 'expanded': 0, 'pushes': 0, 'scanned': 0,
+              'peakOpen': 0}
+    if mode == 'alt':
+        startTime = time.perf_counter()
+        landmarks = pathFinder.buildLandmarks(seed=seed)
+        result['landmarkBuild'] = time.perf_counter() - startTime
+        result['landmarkBytes'] = landmarks.distances.nbytes
+    for start, end in benchmarkQueries(pathFinder, queries, rng):
+        # Best of the repeats, the counters are the same every time
+        search = pathFinder.search(start, end, mode)
+        if mode in OPTIMAL_MODES:
+            optimum = pathFinder.search(start, end, 'astar')
+            if search.cost != optimum.cost:
+                raise AssertionError(f"{mode} found a path of cost {search.cost} from {start} to {end}, "
+                                     f"A* found {optimum.cost}")
+        elapsed = min([search.elapsed] + [pathFinder.search(start, end, mode).elapsed for _ in range(repeats - 1)])
+        result['queries'] += 1
+        result['time'] += elapsed
+        if search.found:
+            result['found'] += 1
+            result['pathLength'] += len(search.path)
+        result['expanded'] += search.expanded
+        result['pushes'] += search.generated
+        result['scanned'] += search.scanned
+        result['peakOpen'] = max(result['peakOpen'], search.peakOpen)
+
+    if memory:
+        # Traced separately since tracemalloc slows the searches down
+        tracemalloc.start()
+        for start, end in benchmarkQueries(pathFinder, queries, np.random.default_rng(seed)):
+            tracemalloc.reset_peak()
+            pathFinder.search(start, end, mode)
+            result['peakMemory'] = max(result.get('peakMemory', 0), tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return result
+
+
+def runSuite(kinds, sizes, densities, braids, modes=None, queries=5, seed=0, memory=True, repeats=3):
+    results = []
+    for kind in kinds:
+        for size in sizes:
+            for level in (densities if kind == 'grid' else braids):
+                for mode in (modes or MODES[kind]):
+                    if mode not in MODES[kind]:
+                        continue
+                    result = benchmarkSearches(kind, size, level, mode, queries, seed, memory, repeats)
+                    results.append(result)
+                    scanned = f"scanned {result['scanned']:9}  " if result['scanned'] else ""
+                    print(f"{kind:4} {size:5} {level:5.2f} {mode:13} {result['time'] * 1000:10.1f} ms  "
+                          f"expanded {result['expanded']:9}  pushes {result['pushes']:9}  {scanned}"
+                          f"peak {result.get('peakMemory', 0) / 2 ** 20:8.1f} MiB", flush=True)
+                    manhattan = next((other for other in results if other['mode'] == 'astar' and
+                                      caseKey(other)[:3] == caseKey(result)[:3]), None)
+                    if mode == 'alt' and manhattan is not None and manhattan['expanded']:
+                        # Same queries with the Manhattan heuristic, ALT only changes the guidance
+                        result['expandedVsManhattan'] = result['expanded'] / manhattan['expanded']
+                        print(f"{'':30} landmarks built in {result['landmarkBuild'] * 1000:.1f} ms "
+                              f"({result['landmarkBytes'] / 2 ** 20:.1f} MiB), expanded "
+                              f"{1 - result['expandedVsManhattan']:.1%} fewer nodes than Manhattan", flush=True)
+    return results
+
+
+def caseKey(result):
+    return (result['kind'], result['size'], result['level'], result['mode'], result['seed'])
+
+
+def compareRuns(baseline, current, threshold=0.25):
+    # Counters are deterministic for a seed, so any increase is reported, times only past the threshold
+    baseResults = {caseKey(result): result for result in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        base = baseResults.get(caseKey(result))
+        if base is None:
+            continue
+        changes = []
+        for counter in COUNTERS:
+            if counter in base and result[counter] > base[counter]:  # Runs older than a counter don't have it
+                changes.append(f"{counter} {base[counter]} -> {result[counter]}")
+                regressions.append((caseKey(result), counter))
+        ratio = result['time'] / base['time'] if base['time'] else 1.0
+        if ratio > 1 + threshold:
+            changes.append("slower")
+            regressions.append((caseKey(result), 'time'))
+        if 'peakMemory' in result and 'peakMemory' in base and result['peakMemory'] > base['peakMemory'] * (1 + threshold):
+            changes.append(f"peak memory x{result['peakMemory'] / base['peakMemory']:.2f}")
+            regressions.append((caseKey(result), 'peakMemory'))
+        kind, size, level, mode, _ = caseKey(result)
+        print(f"{kind:4} {size:5} {level:5.2f} {mode:13} time x{ratio:5.2f}  " + ("; ".join(changes) or "ok"))
+    return regressions
+
+
+def benchmarkTiles(kind, size, level, tileSizes, maxBytes, queries=5, seed=0):
+    # Runs the same queries over tiled copies of one map, the hit rate shows how well each tile size fits
+    pathFinder = generatedPathFinder(kind, size, level, seed)
+    queries = benchmarkQueries(pathFinder, queries, np.random.default_rng(seed))
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for tileSize in tileSizes:
+            filePath = os.path.join(directory, f'{tileSize}.neat')
+            saveTiled(filePath, kind, pathFinder.start, pathFinder.end, pathFinder.structure, tileSize)
+            tiled = TiledPathFinder(filePath, maxBytes=maxBytes)
+            elapsed = sum(tiled.search(start, end).elapsed for start, end in queries)
+            result = {'kind': kind, 'size': size, 'level': level, 'time': elapsed, **tiled.tileStats()}
+            del tiled  # Releases the memory map before the directory is removed
+            results.append(result)
+            print(f"{kind:4} {size:5} tiles {tileSize:5}  {elapsed * 1000:10.1f} ms  hits {result['hits']:9}  "
+                  f"misses {result['misses']:6}  evictions {result['evictions']:6}  hit rate {result['hitRate']:.4f}",
+                  flush=True)
+    return results
+
+
+def peakRss():
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark path finding across map sizes, densities and engines")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    search = commands.add_parser('search', help="Time seeded queries on generated grids and mazes")
+    search.add_argument('--kinds', nargs='+', choices=sorted(ENGINES), default=sorted(ENGINES))
+    search.add_argument('--sizes', type=int, nargs='+', default=[64, 256, 1024, 4096])
+    search.add_argument('--densities', type=float, nargs='+', default=[0.1, 0.25, 0.35])
+    search.add_argument('--braids', type=float, nargs='+', default=[0.0, 0.5])
+    search.add_argument('--modes', nargs='+')
+    search.add_argument('--queries', type=int, default=5)
+    search.add_argument('--repeats', type=int, default=3, help="Runs per query, the fastest is kept")
+    search.add_argument('--seed', type=int, default=0)
+    search.add_argument('--no-memory', action='store_true', help="Skip the tracemalloc pass")
+    search.add_argument('--output', help="Save the results as JSON")
+
+    compare = commands.add_parser('compare', help="Compare two saved runs and fail on regressions")
+    compare.add_argument('baseline')
+    compare.add_argument('current')
+    compare.add_argument('--threshold', type=float, default=0.25, help="Allowed slowdown before a time counts")
+
+    tiles = commands.add_parser('tiles', help="Tile cache hit rates of the tiled backend for several tile sizes")
+    tiles.add_argument('--kinds', nargs='+', choices=sorted(ENGINES), default=sorted(ENGINES))
+    tiles.add_argument('--size', type=int, default=1024)
+    tiles.add_argument('--density', type=float, default=0.25, help="Grid density, mazes are braided by the same share")
+    tiles.add_argument('--tile-sizes', type=int, nargs='+', default=[32, 64, 128, 256, 512])
+    tiles.add_argument('--max-bytes', type=int, default=1 << 20, help="Memory cap of the tile cache")
+    tiles.add_argument('--queries', type=int, default=5)
+    tiles.add_argument('--seed', type=int, default=0)
+    tiles.add_argument('--output', help="Save the results as JSON")
+
+    replan = commands.add_parser('replan', help="Compare incremental replanning with full A* searches")
+    replan.add_argument('--sizes', type=int, nargs='+', default=[64, 128, 256])
+    replan.add_argument('--density', type=float, default=0.2)
+    replan.add_argument('--changes', type=int, default=30)
+    replan.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == 'search':
+        results = runSuite(args.kinds, args.sizes, args.densities, args.braids, args.modes, args.queries,
+                           args.seed, not args.no_memory, args.repeats)
+        if args.output:
+            with open(args.output, 'w') as file:
+                json.dump({'python': sys.version, 'peakRss': peakRss(), 'results': results}, file, indent=1)
+    elif args.command == 'compare':
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        with open(args.current) as file:
+            current = json.load(file)
+        regressions = compareRuns(baseline, current, args.threshold)
+        print(f"{len(regressions)} regressions")
+        sys.exit(1 if regressions else 0)
+    elif args.command == 'tiles':
+        results = [result for kind in args.kinds for result in
+                   benchmarkTiles(kind, args.size, args.density, args.tile_sizes, args.max_bytes, args.queries, args.seed)]
+        if args.output:
+            with open(args.output, 'w') as file:
+                json.dump({'python': sys.version, 'results': results}, file, indent=1)
+    else:
+        for kind in ('grid', 'maze'):
+            for size in args.sizes:
+                result = benchmarkReplanning(kind, size, args.density, args.changes, args.seed)
+                if result['meanReplan'] is None:
+                    print(f"{kind:4} {size:5}  no path to replan")
+                    continue
+                print(f"{kind:4} {size:5}  initial {result['initialPlan'] * 1000:8.1f} ms  "
+                      f"replan {result['meanReplan'] * 1000:8.2f} ms  full A* {result['meanFullSearch'] * 1000:8.2f} ms  "
+                      f"({result['changes']} changes)")
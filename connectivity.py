@@ -0,0 +1,174 @@
+import numpy as np
+from moves import DIRECTIONS, OPPOSITE, LEFT, RIGHT, UP, DOWN, flatOffsets
+
+
+class ConnectivityIndex:
+    # Connected-component labels over the two-way moves of a structure
+    # In both encodings every move into a cell that can be entered is two-way, so a query is reachable exactly
+    # when one of the start's moves lands in the end's component (cells nothing can enter are singletons)
+    localSearchLimit = 4096  # Cells a search around removed links visits before it floods the whole piece
+
+    def __init__(self, moves):
+        self.moves = moves
+        self.height, self.width = moves.shape
+        self.rebuild()
+
+    @classmethod
+    def fromLabels(cls, moves, labels):
+        # Index over labels computed earlier for the same moves, e.g. loaded from a compiled map cache
+        index = cls.__new__(cls)
+        index.moves = moves
+        index.height, index.width = moves.shape
+        index.labels = labels
+        index.merged = {}
+        index.nextLabel = index.height * index.width
+        index.offsets = flatOffsets(index.width)
+        return index
+
+    def rebuild(self):
+        self.labels = self.label(self.moves)
+        self.merged = {}  # Components joined by later updates, label -> label it was merged into
+        self.nextLabel = self.height * self.width  # Labels of pieces split off by later updates, past any cell id
+        self.offsets = flatOffsets(self.width)
+
+    @staticmethod
+    def twoWayLinks(moves):
+        # Links to the right and down that can be walked in both directions
+        right = ((moves[:, :-1] & RIGHT) != 0) & ((moves[:, 1:] & LEFT) != 0)
+        down = ((moves[:-1, :] & DOWN) != 0) & ((moves[1:, :] & UP) != 0)
+        return right, down
+
+    @staticmethod
+    def label(moves):
+        height, width = moves.shape
+        right, down = ConnectivityIndex.twoWayLinks(moves)
+        ids = np.arange(height * width, dtype=np.int64).reshape(height, width)
+        sources = np.concatenate([ids[:, :-1][right], ids[:-1, :][down]])
+        targets = np.concatenate([ids[:, 1:][right], ids[1:, :][down]])
+
+        # Union-find in bulk: hook the larger root of every link onto the smaller one, then jump pointers until
+        # every cell points straight at its root, and repeat while any link still joins two roots
+        parents = ids.ravel().copy()
+        while True:
+            sourceRoots, targetRoots = parents[sources], parents[targets]
+            joining = sourceRoots != targetRoots
+            if not joining.any():
+                break
+            sources, targets = sources[joining], targets[joining]
+            sourceRoots, targetRoots = sourceRoots[joining], targetRoots[joining]
+            np.minimum.at(parents, np.maximum(sourceRoots, targetRoots), np.minimum(sourceRoots, targetRoots))
+            while True:
+                grandparents = parents[parents]
+                if np.array_equal(grandparents, parents):
+                    break
+                parents = grandparents
+
+        labelType = np.int32 if height * width < 2 ** 30 else np.int64  # Headroom for the labels of split pieces
+        return parents.astype(labelType).reshape(height, width)
+
+    def find(self, label):
+        root = label
+        while root in self.merged:
+            root = self.merged[root]
+        while label != root:  # Path compression
+            self.merged[label], label = root, self.merged[label]
+        return root
+
+    def componentOf(self, pos):
+        return self.find(int(self.labels[pos]))
+
+    def canReach(self, start, end):
+        start, end = tuple(start), tuple(end)
+        if start == end:
+            return True
+
+        endComponent = self.componentOf(end)
+        row, col = start
+        mask = self.moves[row, col]
+        return any(mask & bit and self.componentOf((row + dr, col + dc)) == endComponent for (dr, dc), bit in DIRECTIONS)
+
+    def movesChanged(self, top, left, before, after):
+        # before/after are the masks of a window of the structure around a changed cell, self.moves already has after
+        oldRight, oldDown = self.twoWayLinks(before)
+        newRight, newDown = self.twoWayLinks(after)
+        for rows, cols, dr, dc in ((*np.nonzero(newRight & ~oldRight), 0, 1), (*np.nonzero(newDown & ~oldDown), 1, 0)):
+            for row, col in zip(rows + top, cols + left):
+                first, second = self.componentOf((row, col)), self.componentOf((row + dr, col + dc))
+                if first != second:
+                    self.merged[max(first, second)] = min(first, second)
+
+        # A removed link may split its component, the pieces all hold an endpoint of a removed link
+        endpoints = {}  # component -> endpoints of its removed links, as flat ids
+        for rows, cols, dr, dc in ((*np.nonzero(oldRight & ~newRight), 0, 1), (*np.nonzero(oldDown & ~newDown), 1, 0)):
+            for row, col in zip(rows + top, cols + left):
+                cells = endpoints.setdefault(self.componentOf((row, col)), {})
+                cells[int(row) * self.width + int(col)] = None
+                cells[int(row + dr) * self.width + int(col + dc)] = None
+        for cells in endpoints.values():
+            self.splitComponent(list(cells))
+
+    def splitComponent(self, cells):
+        # Endpoints of removed links that shared a component, every piece it fell into but one gets a new label
+        # Small pieces and reconnections are settled by bounded searches, only large pieces are flooded
+        pending, large = cells, []
+        while pending:
+            source = pending.pop()
+            reached, complete = self.localPiece(source, pending + large)
+            pending = [cell for cell in pending if cell not in reached]
+            large = [cell for cell in large if cell not in reached]
+            if not complete:
+                large.append(source)
+            elif pending or large:
+                self.relabel(reached)  # A small piece cut off from the rest
+        while len(large) > 1:
+            label = self.flood(large.pop())
+            labels = self.labels.reshape(-1)
+            large = [cell for cell in large if labels[cell] != label]
+
+    def linkedNeighbours(self, moves, cell):
+        mask = moves[cell]
+        return [cell + offset for offset, (_, bit) in zip(self.offsets, DIRECTIONS)
+                if mask & bit and moves[cell + offset] & OPPOSITE[bit]]
+
+    def localPiece(self, source, targets):
+        # Cells linked to source, searched until every target is found or the search gives up
+        # (reached, complete), complete when reached is the whole piece
+        moves = self.moves.reshape(-1).data
+        targets = set(targets)
+        reached = {source}
+        queue = [source]
+        while queue and len(reached) < self.localSearchLimit:
+            if not targets:
+                return reached, False
+            frontier = []
+            for cell in queue:
+                for neighbour in self.linkedNeighbours(moves, cell):
+                    if neighbour not in reached:
+                        reached.add(neighbour)
+                        targets.discard(neighbour)
+                        frontier.append(neighbour)
+            queue = frontier
+        return reached, not queue
+
+    def relabel(self, cells):
+        labels = self.labels.reshape(-1)
+        labels[list(cells)] = self.nextLabel
+        self.nextLabel += 1
+
+    def flood(self, source):
+        # Gives the whole piece of source a new label, returns it
+        moves = self.moves.reshape(-1).data
+        labels = self.labels.reshape(-1).data
+        label = self.nextLabel
+        self.nextLabel += 1
+        labels[source] = label
+        queue = [source]
+        while queue:
+            frontier = []
+            for cell in queue:
+                for neighbour in self.linkedNeighbours(moves, cell):
+                    if labels[neighbour] != label:
+                        labels[neighbour] = label
+                        frontier.append(neighbour)
+            queue = frontier
+        return label
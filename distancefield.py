@@ -0,0 +1,66 @@
+import numpy as np
+from moves import DIRECTIONS, flatOffsets
+
+
+class DistanceField:
+    # Exact step counts from every cell to one goal, built by a breadth-first wavefront run backwards from the goal
+    def __init__(self, moves, goal):
+        self.moves = moves
+        self.goal = tuple(goal)
+        self.height, self.width = moves.shape
+        self.distances = self.computeDistances(moves, self.goal)
+
+    @staticmethod
+    def computeDistances(moves, goal):
+        width = moves.shape[1]
+        return DistanceField.computeDistancesToCells(moves, [goal[0] * width + goal[1]])
+
+    @staticmethod
+    def computeDistancesToCells(moves, cells):
+        # Distance from every cell to the nearest of several goals given as flat cell ids
+        height, width = moves.shape
+        size = height * width
+        flatMoves = moves.ravel()
+        distances = np.full(size, -1, dtype=np.int32)  # -1 marks cells that can't reach a goal
+
+        frontier = np.unique(np.asarray(cells, dtype=np.int64))
+        distances[frontier] = 0
+        distance = 0
+        while frontier.size:
+            distance += 1
+            candidates = []
+            for offset, (_, bit) in zip(flatOffsets(width), DIRECTIONS):
+                # Cells one step against this direction can reach the frontier if their mask allows the move
+                sources = frontier - offset
+                sources = sources[(sources >= 0) & (sources < size)]
+                sources = sources[(flatMoves[sources] & bit) != 0]
+                candidates.append(sources)
+
+            frontier = np.concatenate(candidates)
+            frontier = np.unique(frontier[distances[frontier] < 0])
+            distances[frontier] = distance
+
+        return distances.reshape(height, width)
+
+    def distanceFrom(self, pos):
+        distance = int(self.distances[pos])
+        return None if distance < 0 else distance
+
+    def pathFrom(self, start):
+        # Follows the gradient down to the goal, one lookup per step
+        start = tuple(start)
+        distance = self.distanceFrom(start)
+        if distance is None:
+            return None
+
+        path = [start]
+        row, col = start
+        while distance > 0:
+            mask = self.moves[row, col]
+            for (dr, dc), bit in DIRECTIONS:
+                if mask & bit and self.distances[row + dr, col + dc] == distance - 1:
+                    row, col = row + dr, col + dc
+                    break
+            distance -= 1
+            path.append((row, col))
+        return path
@@ -0,0 +1,134 @@
+import heapq
+import sys
+from array import array
+from moves import DIRECTIONS
+
+INFINITY = sys.maxsize
+
+
+class DStarLite:
+    # Incremental replanner (D* Lite): searches backwards from the goal and keeps g/rhs values between calls,
+    # so after setCell only the part of the search the changed cells affect is repaired
+    def __init__(self, pathFinder, start, goal):
+        self.pathFinder = pathFinder
+        self.width = pathFinder.width
+        self.start = tuple(start)
+        self.goal = tuple(goal)
+        self.lastStart = self.start
+        self.keyModifier = 0  # km, grows by the heuristic distance each time the start moves
+
+        size = pathFinder.height * pathFinder.width
+        self.g = array('l', [INFINITY]) * size
+        self.rhs = array('l', [INFINITY]) * size
+        self.openList = []
+        self.queued = {}  # cell -> key it is queued with, anything else in openList is stale
+        self.changedCells = set()
+        self.expanded = 0  # Vertices expanded over the planner's lifetime
+
+        goalId = self.cellId(self.goal)
+        self.rhs[goalId] = 0
+        self.push(goalId)
+        pathFinder.replanners.add(self)
+
+    def cellId(self, pos):
+        return pos[0] * self.width + pos[1]
+
+    def heuristic(self, cell):
+        row, col = divmod(cell, self.width)
+        return abs(row - self.start[0]) + abs(col - self.start[1])
+
+    def key(self, cell):
+        best = min(self.g[cell], self.rhs[cell])
+        if best == INFINITY:
+            return (INFINITY, INFINITY)
+        return (best + self.heuristic(cell) + self.keyModifier, best)
+
+    def push(self, cell):
+        key = self.key(cell)
+        self.queued[cell] = key
+        heapq.heappush(self.openList, (key, cell))
+
+    def successors(self, cell, moves):
+        mask = moves[divmod(cell, self.width)]
+        return [cell + dr * self.width + dc for (dr, dc), bit in DIRECTIONS if mask & bit]
+
+    def predecessors(self, cell, moves):
+        # Neighbours whose own mask allows the step into this cell
+        row, col = divmod(cell, self.width)
+        height = self.pathFinder.height
+        cells = []
+        for (dr, dc), bit in DIRECTIONS:
+            neighbourRow, neighbourCol = row - dr, col - dc
+            if 0 <= neighbourRow < height and 0 <= neighbourCol < self.width and moves[neighbourRow, neighbourCol] & bit:
+                cells.append(cell - dr * self.width - dc)
+        return cells
+
+    def updateVertex(self, cell, moves):
+        if cell != self.cellId(self.goal):
+            self.rhs[cell] = min((self.g[successor] + 1 for successor in self.successors(cell, moves)
+                                  if self.g[successor] != INFINITY), default=INFINITY)
+        self.queued.pop(cell, None)
+        if self.g[cell] != self.rhs[cell]:
+            self.push(cell)
+
+    def topKey(self):
+        while self.openList and self.queued.get(self.openList[0][1]) != self.openList[0][0]:
+            heapq.heappop(self.openList)  # Stale entry
+        return self.openList[0][0] if self.openList else (INFINITY, INFINITY)
+
+    def computeShortestPath(self, moves):
+        startId = self.cellId(self.start)
+        while self.topKey() < self.key(startId) or self.rhs[startId] != self.g[startId]:
+            oldKey, cell = heapq.heappop(self.openList)
+            newKey = self.key(cell)
+            if oldKey < newKey:
+                self.push(cell)
+                continue
+
+            del self.queued[cell]
+            self.expanded += 1
+            if self.g[cell] > self.rhs[cell]:
+                self.g[cell] = self.rhs[cell]
+                for predecessor in self.predecessors(cell, moves):
+                    self.updateVertex(predecessor, moves)
+            else:
+                self.g[cell] = INFINITY
+                for predecessor in self.predecessors(cell, moves) + [cell]:
+                    self.updateVertex(predecessor, moves)
+
+    def cellChanged(self, pos):
+        self.changedCells.add(tuple(pos))
+
+    def moveStart(self, pos):
+        # Called as the agent moves along its path
+        self.start = tuple(pos)
+        self.keyModifier += abs(self.lastStart[0] - self.start[0]) + abs(self.lastStart[1] - self.start[1])
+        self.lastStart = self.start
+
+    def path(self):
+        moves = self.pathFinder.getMoves()
+        if self.changedCells:
+            # A changed cell alters its own moves and the moves of its four neighbours into it
+            affected = set()
+            for row, col in self.changedCells:
+                affected.add(self.cellId((row, col)))
+                for (dr, dc), bit in DIRECTIONS:
+                    if 0 <= row + dr < self.pathFinder.height and 0 <= col + dc < self.width:
+                        affected.add(self.cellId((row + dr, col + dc)))
+            self.changedCells.clear()
+            for cell in affected:
+                self.updateVertex(cell, moves)
+
+        self.computeShortestPath(moves)
+
+        cell = self.cellId(self.start)
+        if self.g[cell] == INFINITY:
+            return None
+        path = [self.start]
+        goalId = self.cellId(self.goal)
+        while cell != goalId:
+            cell = min(self.successors(cell, moves), key=lambda successor: self.g[successor])
+            if self.g[cell] == INFINITY:
+                return None
+            path.append(divmod(cell, self.width))
+        return path
@@ -1,18 +1,150 @@
 from pathfinder import PathFinder
-from node import Node
+from moves import LEFT, RIGHT, UP, DOWN
+from jumptables import JumpTables
+import heapq
+import sys
+import numpy as np
 
 class GridPathFinder(PathFinder):
-    def getNeighbour(self, node, grid):
-        neighbors = []
-        for newPos in [(0, -1), (0, 1), (-1, 0), (1, 0)]:  # Adjacent squares
-            nodePos = (node.pos[0] + newPos[0], node.pos[1] + newPos[1])
-            if nodePos[0] < 0 or nodePos[0] >= len(grid) or nodePos[1] < 0 or nodePos[1] >= len(grid[0]):
-                continue  # Node is out of bounds
-            if grid[nodePos[0]][nodePos[1]] != 0:
-                continue  # Node is not walkable
-            neighbors.append(Node(node, nodePos))
-        return neighbors
-
-    def generateStructure(self, start, end, height, width):
-        #* I need to implement this method
-        pass
\ No newline at end of file
+    kind = 'grid'
+
+    def findPath(self, start=None, end=None, mode='astar', **options):
+        if mode == 'jps':
+            start, end = self.endpoints(start, end)
+            return self.jumpPointSearch(start, end, self.structure)
+        return super().findPath(start, end, mode, **options)
+
+    def jumpTablesFor(self, grid):
+        # Tables for the loaded structure are built once and dropped by setCell, any other grid is done on the spot
+        if grid is not self.structure:
+            return JumpTables(grid)
+        if self.jumpTables is None:
+            self.jumpTables = JumpTables(grid)
+        return self.jumpTables
+
+    def compileMoves(self, grid):
+        # A move is allowed when the target cell is in bounds and walkable
+        walkable = grid == 0
+        moves = np.zeros(grid.shape, dtype=np.uint8)
+        moves[:, 1:] |= np.where(walkable[:, :-1], LEFT, 0).astype(np.uint8)
+        moves[:, :-1] |= np.where(walkable[:, 1:], RIGHT, 0).astype(np.uint8)
+        moves[1:, :] |= np.where(walkable[:-1, :], UP, 0).astype(np.uint8)
+        moves[:-1, :] |= np.where(walkable[1:, :], DOWN, 0).astype(np.uint8)
+        return moves
+
+    def jumpPointSearch(self, start, end, grid):
+        # A* over jump points only, for 4-connected unit-cost moves (the grids have no diagonal moves)
+        # Horizontal runs only turn at forced neighbours, vertical runs stop at rows with a jump point either side
+        # Every jump is one lookup in the JumpTables of the grid instead of a scan over its cells
+        if self.isUnreachable(start, end, grid):
+            return None
+        tables = self.jumpTablesFor(grid)
+        stride = tables.stride
+        right, left, down, up = tables.right, tables.left, tables.down, tables.up
+        walkable = tables.walkable
+        startId = (start[0] + 1) * stride + start[1] + 1
+        endId = (end[0] + 1) * stride + end[1] + 1
+        endRow = end[0] + 1
+        scanned = 0  # Jump table entries read, each one stands for a run of cells a plain scan would step over
+
+        def jumpHorizontal(cell, step):
+            nonlocal scanned
+            scanned += 1
+            distance = right[cell] if step > 0 else left[cell]
+            reach = distance if distance > 0 else -distance - 1  # Open cells before the stop
+            # The end stops a jump too, the border keeps cell + reach in the same row
+            if (cell < endId <= cell + reach) if step > 0 else (cell - reach <= endId < cell):
+                return endId
+            return cell + step * distance if distance > 0 else None
+
+        def jumpVertical(cell, step):
+            nonlocal scanned
+            scanned += 1
+            distance = down[cell] if step > 0 else up[cell]
+            reach = distance if distance > 0 else -distance - 1
+            # Jumps stop at the end's row when a horizontal jump from there reaches the end
+            rows = (endRow - cell // stride) * (1 if step > 0 else -1)
+            if 0 < rows <= reach:
+                crossing = cell + rows * step
+                if crossing == endId or jumpHorizontal(crossing, -1) is not None or jumpHorizontal(crossing, 1) is not None:
+                    return crossing
+            return cell + step * distance if distance > 0 else None
+
+        openList = []
+        count = 0  # Counter for tie-breaking, also counts the pushes after the start
+        expanded = 0
+        peakOpen = 1
+        trace = self.traceHook
+        bestG = {startId: 0}
+        parents = {startId: None}
+        closed = set()
+        heapq.heappush(openList, (self.manhattanDist(start, end), count, startId, 0))
+
+        while len(openList) > 0:
+            _, _, cell, arrival = heapq.heappop(openList)
+            if cell in closed:
+                continue  # Stale entry
+            closed.add(cell)
+            expanded += 1
+            if trace is not None:
+                trace((cell // stride - 1, cell % stride - 1), bestG[cell])
+
+            if cell == endId:
+                self.searchStats = {'expanded': expanded, 'pushes': count + 1, 'peakOpen': peakOpen, 'scanned': scanned}
+                jumpPoints = []
+                while cell is not None:
+                    jumpPoints.append(divmod(cell, stride))
+                    cell = parents[cell]
+                jumpPoints = [(row - 1, col - 1) for row, col in reversed(jumpPoints)]
+
+                # Fill in the straight runs between consecutive jump points
+                path = [jumpPoints[0]]
+                for (row, col), (nextRow, nextCol) in zip(jumpPoints, jumpPoints[1:]):
+                    dr = (nextRow > row) - (nextRow < row)
+                    dc = (nextCol > col) - (nextCol < col)
+                    while (row, col) != (nextRow, nextCol):
+                        row, col = row + dr, col + dc
+                        path.append((row, col))
+                return path
+
+            if arrival == 0:  # Start cell, try every direction
+                steps = [-1, 1, -stride, stride]
+            elif arrival in (-1, 1):  # Arrived horizontally, keep going and turn only into forced neighbours
+                steps = [arrival]
+                for vertical in (-stride, stride):
+                    if walkable[cell + vertical] and not walkable[cell + vertical - arrival]:
+                        steps.append(vertical)
+            else:  # Arrived vertically, keep going and branch both ways horizontally
+                steps = [arrival, -1, 1]
+
+            for step in steps:
+                horizontal = step in (-1, 1)
+                jumpPoint = jumpHorizontal(cell, step) if horizontal else jumpVertical(cell, step)
+                if jumpPoint is None or jumpPoint in closed:
+                    continue
+
+                distance = abs(jumpPoint - cell) if horizontal else abs(jumpPoint - cell) // stride
+                g = bestG[cell] + distance
+                if g >= bestG.get(jumpPoint, sys.maxsize):
+                    continue
+                bestG[jumpPoint] = g
+                parents[jumpPoint] = cell
+                row, col = divmod(jumpPoint, stride)
+                count += 1
+                heapq.heappush(openList, (g + self.manhattanDist((row - 1, col - 1), end), count, jumpPoint, step))
+
+            if len(openList) > peakOpen:
+                peakOpen = len(openList)
+
+        self.searchStats = {'expanded': expanded, 'pushes': count + 1, 'peakOpen': peakOpen, 'scanned': scanned}
+
+    def generateStructure(self, start, end, height, width, density=0.25, seed=None):
+        # Random obstacles, each cell is blocked with probability density
+        rng = np.random.default_rng(seed)
+        grid = np.empty((height, width), dtype=np.uint8)
+        for top in range(0, height, self.generateRows):
+            block = grid[top:top + self.generateRows]
+            np.less(rng.random(block.shape, dtype=np.float32), density, out=block, casting='unsafe')
+        grid[start] = 0
+        grid[end] = 0
+        self.setStructure(grid)
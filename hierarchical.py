@@ -0,0 +1,281 @@
+import argparse
+import heapq
+import numpy as np
+from distancefield import DistanceField
+from moves import DIRECTIONS, LEFT, RIGHT, UP, DOWN, reverseMoves, hashMoves
+
+
+class ClusterAbstraction:
+    # HPA* abstraction: the map is cut into square clusters, cells on either side of each border opening become
+    # abstract nodes, and the distances between the nodes of a cluster are precomputed once
+    # Paths are near-optimal rather than optimal because routes are forced through the chosen border cells
+    formatVersion = 1
+    maxSingleEntrance = 6  # Openings shorter than this get one transition in the middle, longer ones one at each end
+
+    def __init__(self, moves, clusterSize=16):
+        self.moves = moves
+        self.clusterSize = clusterSize
+        self.height, self.width = moves.shape
+        self.clusterCols = -(-self.width // clusterSize)
+        self.localMoves = self.restrictToClusters(moves, clusterSize)
+
+    @classmethod
+    def build(cls, moves, clusterSize=16):
+        abstraction = cls(moves, clusterSize)
+        nodes, edges = abstraction.findTransitions()
+        abstraction.setGraph(nodes, *abstraction.addIntraEdges(nodes, edges))
+        return abstraction
+
+    @classmethod
+    def load(cls, filePath, moves):
+        with np.load(filePath) as data:
+            if int(data['formatVersion']) != cls.formatVersion:
+                raise ValueError(f"Unsupported abstraction version in {filePath}")
+            if str(data['movesHash']) != hashMoves(moves):
+                raise ValueError(f"Abstraction in {filePath} was built for a different structure")
+            abstraction = cls(moves, int(data['clusterSize']))
+            abstraction.setGraph(data['nodes'], data['edgeSources'], data['edgeTargets'], data['edgeCosts'])
+        return abstraction
+
+    def save(self, filePath):
+        np.savez_compressed(filePath, formatVersion=self.formatVersion, clusterSize=self.clusterSize,
+                            movesHash=hashMoves(self.moves), nodes=self.nodes, edgeSources=self.edgeSources,
+                            edgeTargets=self.edgeTargets, edgeCosts=self.edgeCosts)
+
+    @staticmethod
+    def restrictToClusters(moves, clusterSize):
+        # Clears every move that would cross a cluster border so searches stay inside one cluster
+        local = moves.copy()
+        local[:, ::clusterSize] &= ~np.uint8(LEFT)
+        local[:, clusterSize - 1::clusterSize] &= ~np.uint8(RIGHT)
+        local[::clusterSize, :] &= ~np.uint8(UP)
+        local[clusterSize - 1::clusterSize, :] &= ~np.uint8(DOWN)
+        return local
+
+    def clusterOf(self, cells):
+        rows, cols = np.divmod(cells, self.width)
+        return (rows // self.clusterSize) * self.clusterCols + cols // self.clusterSize
+
+    def clusterBounds(self, cell):
+        row, col = divmod(int(cell), self.width)
+        top = row - row % self.clusterSize
+        left = col - col % self.clusterSize
+        return top, left, min(top + self.clusterSize, self.height), min(left + self.clusterSize, self.width)
+
+    def findTransitions(self):
+        size = self.clusterSize
+        pairs = []
+
+        # Vertical borders, crossing right from column col - 1 into col
+        for col in range(size, self.width, size):
+            crossable = ((self.moves[:, col - 1] & RIGHT) != 0) & ((self.moves[:, col] & LEFT) != 0)
+            linked = self.linkedAlong(self.moves[:, col - 1], DOWN, UP) & self.linkedAlong(self.moves[:, col], DOWN, UP)
+            for row in self.pickTransitions(crossable, linked):
+                pairs.append((row * self.width + col - 1, row * self.width + col))
+
+        # Horizontal borders, crossing down from row - 1 into row
+        for row in range(size, self.height, size):
+            crossable = ((self.moves[row - 1, :] & DOWN) != 0) & ((self.moves[row, :] & UP) != 0)
+            linked = self.linkedAlong(self.moves[row - 1, :], RIGHT, LEFT) & self.linkedAlong(self.moves[row, :], RIGHT, LEFT)
+            for col in self.pickTransitions(crossable, linked):
+                pairs.append(((row - 1) * self.width + col, row * self.width + col))
+
+        pairs = np.array(pairs, dtype=np.int64).reshape(-1, 2)
+        nodes = np.unique(pairs)
+        index = np.searchsorted(nodes, pairs)
+        # Each transition is a unit step both ways
+        edges = (np.concatenate([index[:, 0], index[:, 1]]), np.concatenate([index[:, 1], index[:, 0]]),
+                 np.ones(2 * len(pairs), dtype=np.int32))
+        return nodes, edges
+
+    @staticmethod
+    def linkedAlong(line, forward, backward):
+        # Whether each cell of a border line and the next one can step into each other
+        return ((line[:-1] & forward) != 0) & ((line[1:] & backward) != 0)
+
+    def pickTransitions(self, crossable, linked):
+        # An opening is a run of crossable cells that are also linked along both sides of the border,
+        # so every cell of an opening can reach the transitions chosen for it
+        positions = []
+        for segmentStart in range(0, len(crossable), self.clusterSize):
+            segment = crossable[segmentStart:segmentStart + self.clusterSize]
+            joined = segment[:-1] & segment[1:] & linked[segmentStart:segmentStart + len(segment) - 1]
+            runStarts = np.flatnonzero(segment & ~np.concatenate(([False], joined)))
+            runEnds = np.flatnonzero(segment & ~np.concatenate((joined, [False])))
+            for runStart, runEnd in zip(runStarts, runEnds):
+                if runEnd - runStart + 1 < self.maxSingleEntrance:
+                    positions.append(segmentStart + (runStart + runEnd) // 2)
+                else:
+                    positions.extend((segmentStart + runStart, segmentStart + runEnd))
+        return positions
+
+    def addIntraEdges(self, nodes, edges):
+        sources, targets, costs = [edges[0]], [edges[1]], [edges[2]]
+        if len(nodes) == 0:
+            return sources[0], targets[0], costs[0]
+
+        # Rank each node within its cluster, then one multi-source wavefront per rank covers every cluster at once
+        clusters = self.clusterOf(nodes)
+        order = np.argsort(clusters, kind='stable')
+        firstOfCluster = np.searchsorted(clusters[order], clusters[order])
+        ranks = np.empty(len(nodes), dtype=np.int64)
+        ranks[order] = np.arange(len(nodes)) - firstOfCluster
+
+        clusterCount = self.clusterCols * -(-self.height // self.clusterSize)
+        for rank in range(int(ranks.max()) + 1):
+            targetNodes = np.flatnonzero(ranks == rank)
+            targetOfCluster = np.full(clusterCount, -1, dtype=np.int64)
+            targetOfCluster[clusters[targetNodes]] = targetNodes
+
+            distances = DistanceField.computeDistancesToCells(self.localMoves, nodes[targetNodes]).ravel()
+            nodeTargets = targetOfCluster[clusters]
+            nodeDistances = distances[nodes]
+            valid = (nodeTargets >= 0) & (nodeTargets != np.arange(len(nodes))) & (nodeDistances > 0)
+            sources.append(np.flatnonzero(valid))
+            targets.append(nodeTargets[valid])
+            costs.append(nodeDistances[valid])
+
+        return np.concatenate(sources), np.concatenate(targets), np.concatenate(costs).astype(np.int32)
+
+    def setGraph(self, nodes, edgeSources, edgeTargets, edgeCosts):
+        self.nodes = np.asarray(nodes, dtype=np.int64)
+        self.edgeSources = np.asarray(edgeSources, dtype=np.int64)
+        self.edgeTargets = np.asarray(edgeTargets, dtype=np.int64)
+        self.edgeCosts = np.asarray(edgeCosts, dtype=np.int32)
+        self.nodeClusters = self.clusterOf(self.nodes)
+
+        self.adjacency = [[] for _ in range(len(self.nodes))]
+        for source, target, cost in zip(self.edgeSources.tolist(), self.edgeTargets.tolist(), self.edgeCosts.tolist()):
+            self.adjacency[source].append((target, cost))
+
+    def localDistances(self, cell, towards):
+        # Distances inside the cell's cluster, to the cell or (towards=False) from it
+        top, left, bottom, right = self.clusterBounds(cell)
+        local = self.localMoves[top:bottom, left:right]
+        if not towards:
+            local = reverseMoves(local)
+        row, col = divmod(int(cell), self.width)
+        return DistanceField.computeDistances(local, (row - top, col - left)), (top, left)
+
+    def nodesNear(self, cell, towards):
+        # Abstract nodes in the cell's cluster with the distance between them and the cell
+        distances, (top, left) = self.localDistances(cell, towards)
+        cluster = self.clusterOf(np.array([cell]))[0]
+        near = []
+        for index in np.flatnonzero(self.nodeClusters == cluster):
+            row, col = divmod(int(self.nodes[index]), self.width)
+            distance = int(distances[row - top, col - left])
+            if distance >= 0:
+                near.append((int(index), distance))
+        return near
+
+    def findPath(self, start, end):
+        # Abstract-graph search counters of the last call are left in searchStats, nodes rather than cells
+        start, end = tuple(start), tuple(end)
+        self.searchStats = None
+        if start == end:
+            return [start]
+        startCell = start[0] * self.width + start[1]
+        endCell = end[0] * self.width + end[1]
+        endCluster = self.clusterOf(np.array([endCell]))[0]
+        endEdges = {index: distance for index, distance in self.nodesNear(endCell, towards=True)}
+        endDistances, (endTop, endLeft) = self.localDistances(endCell, towards=True)
+
+        # Start and end join the abstract graph as extra nodes. A start cell that can't be entered (a blocked grid
+        # cell) is never a transition, so its steps straight over a border are added as extra nodes too
+        startCells = [startCell]
+        row, col = start
+        for (dr, dc), bit in DIRECTIONS:
+            if self.moves[row, col] & bit:
+                neighbour = (row + dr) * self.width + col + dc
+                if self.clusterOf(np.array([neighbour]))[0] != self.clusterOf(np.array([startCell]))[0]:
+                    startCells.append(neighbour)
+
+        endIndex = len(self.nodes)
+        startIndex = endIndex + 1
+        cells = {endIndex: endCell}
+        virtualEdges = {}
+        for index, cell in enumerate(startCells, startIndex):
+            cells[index] = cell
+            virtualEdges[index] = self.nodesNear(cell, towards=False)
+            if self.clusterOf(np.array([cell]))[0] == endCluster:
+                row, col = divmod(cell, self.width)
+                direct = int(endDistances[row - endTop, col - endLeft])
+                if direct >= 0:
+                    virtualEdges[index].append((endIndex, direct))
+        virtualEdges[startIndex].extend((index, 1) for index in range(startIndex + 1, startIndex + len(startCells)))
+
+        def cellOf(index):
+            return cells[index] if index >= len(self.nodes) else int(self.nodes[index])
+
+        def heuristic(index):
+            row, col = divmod(cellOf(index), self.width)
+            return abs(row - end[0]) + abs(col - end[1])
+
+        openList = [(heuristic(startIndex), 0, startIndex)]
+        count = 0  # Counter for tie-breaking, also counts the pushes after the start node
+        expanded = 0
+        peakOpen = 1
+        bestG = {startIndex: 0}
+        parents = {startIndex: None}
+        closed = set()
+        while len(openList) > 0:
+            _, _, current = heapq.heappop(openList)
+            if current in closed:
+                continue
+            closed.add(current)
+            expanded += 1
+            if current == endIndex:
+                self.searchStats = {'expanded': expanded, 'pushes': count + 1, 'peakOpen': peakOpen}
+                abstractPath = []
+                while current is not None:
+                    abstractPath.append(cellOf(current))
+                    current = parents[current]
+                return self.refinePath(abstractPath[::-1])
+
+            if current in virtualEdges:
+                successors = virtualEdges[current]
+            else:
+                successors = list(self.adjacency[current])
+                if current in endEdges:
+                    successors.append((endIndex, endEdges[current]))
+            for successor, cost in successors:
+                g = bestG[current] + cost
+                if successor in closed or g >= bestG.get(successor, g + 1):
+                    continue
+                bestG[successor] = g
+                parents[successor] = current
+                count += 1
+                heapq.heappush(openList, (g + heuristic(successor), count, successor))
+            if len(openList) > peakOpen:
+                peakOpen = len(openList)
+        self.searchStats = {'expanded': expanded, 'pushes': count + 1, 'peakOpen': peakOpen}
+        return None
+
+    def refinePath(self, abstractPath):
+        path = [divmod(abstractPath[0], self.width)]
+        for cell, nextCell in zip(abstractPath, abstractPath[1:]):
+            if self.clusterOf(np.array([cell]))[0] != self.clusterOf(np.array([nextCell]))[0]:
+                path.append(divmod(nextCell, self.width))  # Transition across a border
+                continue
+            top, left, bottom, right = self.clusterBounds(cell)
+            row, col = divmod(nextCell, self.width)
+            field = DistanceField(self.localMoves[top:bottom, left:right], (row - top, col - left))
+            row, col = divmod(cell, self.width)
+            path.extend((r + top, c + left) for r, c in field.pathFrom((row - top, col - left))[1:])
+        return [(int(row), int(col)) for row, col in path]
+
+
+if __name__ == '__main__':
+    from gridpathfinder import GridPathFinder
+    from mazepathfinder import MazePathFinder
+
+    parser = argparse.ArgumentParser(description="Build and save the cluster abstraction for a map")
+    parser.add_argument('source', help="Map file, CSV or binary")
+    parser.add_argument('target', help="Abstraction file to write (.npz)")
+    parser.add_argument('--kind', choices=('grid', 'maze'), required=True)
+    parser.add_argument('--cluster-size', type=int, default=16)
+    args = parser.parse_args()
+
+    pathFinder = (GridPathFinder if args.kind == 'grid' else MazePathFinder)(args.source)
+    pathFinder.buildHierarchy(args.cluster_size).save(args.target)
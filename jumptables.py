@@ -0,0 +1,56 @@
+import numpy as np
+
+
+class JumpTables:
+    # JPS+ style jump distances of a grid, so a jump point search jumps with one lookup instead of a scan
+    # Tables are over the grid padded with a blocked border and indexed by padded flat id, (row + 1) * stride + col + 1
+    # An entry d > 0 means the jump in that direction stops at a jump point d cells away, d < 0 that it runs into
+    # a blocked cell -d cells away, so -d - 1 open cells can be crossed
+    bandSize = 1024  # Rows or columns computed at a time, bounds the temporary memory
+
+    def __init__(self, grid):
+        height, width = grid.shape
+        self.stride = width + 2
+        walkable = np.pad(grid == 0, 1)
+        dtype = np.int16 if max(height, width) + 2 < 2 ** 15 else np.int32
+        right = np.zeros(walkable.shape, dtype=dtype)
+        left = np.zeros(walkable.shape, dtype=dtype)
+        down = np.zeros(walkable.shape, dtype=dtype)
+        up = np.zeros(walkable.shape, dtype=dtype)
+
+        # A horizontal jump stops at a forced neighbour: a cell above or below that opens up just past a blocked one
+        for top in range(1, height + 1, self.bandSize):
+            bottom = min(top + self.bandSize, height + 1)
+            rows, above, below = walkable[top:bottom], walkable[top - 1:bottom - 1], walkable[top + 1:bottom + 1]
+            forcedRight = np.zeros(rows.shape, dtype=bool)
+            forcedRight[:, 1:] = (above[:, 1:] & ~above[:, :-1]) | (below[:, 1:] & ~below[:, :-1])
+            forcedLeft = np.zeros(rows.shape, dtype=bool)
+            forcedLeft[:, :-1] = (above[:, :-1] & ~above[:, 1:]) | (below[:, :-1] & ~below[:, 1:])
+            right[top:bottom] = self.forwardDistances(forcedRight & rows | ~rows, rows)
+            left[top:bottom] = self.forwardDistances((forcedLeft & rows | ~rows)[:, ::-1], rows[:, ::-1])[:, ::-1]
+
+        # A vertical jump stops at every row where a horizontal jump would find a jump point
+        turns = (right > 0) | (left > 0)
+        for first in range(1, width + 1, self.bandSize):
+            last = min(first + self.bandSize, width + 1)
+            cols, colTurns = walkable[:, first:last].T, turns[:, first:last].T
+            down[:, first:last] = self.forwardDistances(colTurns & cols | ~cols, cols).T
+            up[:, first:last] = self.forwardDistances((colTurns & cols | ~cols)[:, ::-1], cols[:, ::-1])[:, ::-1].T
+
+        self.walkable = walkable.tobytes()  # For the forced neighbour checks when a search turns
+        self.nbytes = right.nbytes * 4 + len(self.walkable)
+        # Flat views, plain int indexing in the search loop
+        self.right, self.left, self.down, self.up = (table.ravel().data for table in (right, left, down, up))
+
+    @staticmethod
+    def forwardDistances(stops, walkable):
+        # Per row, the distance from every cell to the first stop after it, negated when that stop is blocked
+        # Rows end in a blocked border cell, so every cell but the last has a stop after it
+        length = stops.shape[1]
+        positions = np.arange(length, dtype=np.int32)
+        nextStop = np.minimum.accumulate(np.where(stops, positions, length)[:, ::-1], axis=1)[:, ::-1]
+        after = np.full(stops.shape, length - 1, dtype=np.int32)
+        after[:, :-1] = nextStop[:, 1:]
+        distances = after - positions
+        distances[:, -1] = 1
+        return np.where(np.take_along_axis(walkable, after, axis=1), distances, -distances)
@@ -0,0 +1,109 @@
+from array import array
+from collections import deque
+import numpy as np
+from connectivity import ConnectivityIndex
+from moves import flatSteps, reverseMoves, hashMoves
+
+UNREACHABLE = np.iinfo(np.uint32).max
+
+
+class LandmarkTable:
+    # ALT heuristic: exact distances from a few landmark cells bound the distance between any two cells by the
+    # triangle inequality, |d(L, v) - d(L, t)| <= d(v, t), which is far tighter than Manhattan around dead ends
+    # The bound needs d(v, t) = d(t, v), which holds between every cell a search can enter in both encodings
+    formatVersion = 1
+
+    def __init__(self, moves, cells, distances):
+        self.moves = moves
+        self.cells = [tuple(cell) for cell in cells]
+        self.distances = np.ascontiguousarray(distances, dtype=np.uint32)  # One row of height * width per landmark
+        self.tables = [row.data for row in self.distances]  # Plain int indexing in the search loop
+
+    @classmethod
+    def build(cls, moves, count=8, seed=0):
+        # Farthest-point selection: each landmark is the cell farthest from the ones already picked
+        # Selection starts in the largest component and moves on to the largest one left once a component is
+        # covered, so a seed in a small pocket can't keep every landmark there
+        height, width = moves.shape
+        enterable = reverseMoves(moves).ravel() != 0
+        if not enterable.any() or count < 1:
+            return cls(moves, [], np.zeros((0, height * width), dtype=np.uint32))
+
+        labels = ConnectivityIndex.label(moves).ravel()
+        rng = np.random.default_rng(seed)
+        nearest = np.full(height * width, -1, dtype=np.int64)  # Distance to the nearest landmark, -1 if none reaches
+        cells, distances = [], []
+        landmark = cls.farthestInLargest(moves, labels, enterable, rng)
+        while len(cells) < count:
+            landmarkDistances = cls.distancesFrom(moves, landmark)
+            cells.append(divmod(landmark, width))
+            distances.append(np.where(landmarkDistances >= 0, landmarkDistances, UNREACHABLE).astype(np.uint32))
+            reached = landmarkDistances >= 0
+            nearest[reached] = np.where(nearest[reached] >= 0, np.minimum(nearest[reached], landmarkDistances[reached]),
+                                        landmarkDistances[reached])
+            landmark = int(np.argmax(nearest))
+            if nearest[landmark] <= 0:
+                # Every cell the landmarks reach is a landmark already, carry on in the cells nothing reaches
+                unreached = enterable & (nearest < 0)
+                if not unreached.any():
+                    break
+                landmark = cls.farthestInLargest(moves, labels, unreached, rng)
+        return cls(moves, cells, np.stack(distances))
+
+    @classmethod
+    def farthestInLargest(cls, moves, labels, candidates, rng):
+        # Cell of the largest component among the candidates that is farthest from a random cell of it
+        component = int(np.argmax(np.bincount(labels[candidates])))
+        seedDistances = cls.distancesFrom(moves, int(rng.choice(np.flatnonzero(candidates & (labels == component)))))
+        return int(np.argmax(seedDistances))
+
+    @staticmethod
+    def distancesFrom(moves, cell):
+        # Breadth-first search over the move masks, a thin maze frontier makes this faster than a wavefront
+        height, width = moves.shape
+        flatMoves = np.ascontiguousarray(moves).data.cast('B')
+        steps = flatSteps(width)
+        distances = array('l', [-1]) * (height * width)
+        distances[cell] = 0
+        queue = deque([cell])
+        while queue:
+            current = queue.popleft()
+            distance = distances[current] + 1
+            for step in steps[flatMoves[current]]:
+                neighbour = current + step
+                if distances[neighbour] < 0:
+                    distances[neighbour] = distance
+                    queue.append(neighbour)
+        return np.frombuffer(distances, dtype=np.dtype(f'i{distances.itemsize}'))
+
+    def heuristicTo(self, goal):
+        # h(cellId) for one goal, the largest of the Manhattan distance and every landmark's bound
+        height, width = self.moves.shape
+        goalId = goal[0] * width + goal[1]
+        goalRow, goalCol = goal
+        bounds = [(table, table[goalId]) for table in self.tables if table[goalId] != UNREACHABLE]
+
+        def heuristic(cellId):
+            row, col = divmod(cellId, width)
+            best = abs(row - goalRow) + abs(col - goalCol)
+            for table, goalDistance in bounds:
+                distance = table[cellId]
+                if distance != UNREACHABLE:
+                    bound = distance - goalDistance if distance > goalDistance else goalDistance - distance
+                    if bound > best:
+                        best = bound
+            return best
+        return heuristic
+
+    @classmethod
+    def load(cls, filePath, moves):
+        with np.load(filePath) as data:
+            if int(data['formatVersion']) != cls.formatVersion:
+                raise ValueError(f"Unsupported landmark table version in {filePath}")
+            if str(data['movesHash']) != hashMoves(moves):
+                raise ValueError(f"Landmarks in {filePath} were built for a different structure")
+            return cls(moves, data['cells'], data['distances'])
+
+    def save(self, filePath):
+        np.savez_compressed(filePath, formatVersion=self.formatVersion, movesHash=hashMoves(self.moves),
+                            cells=np.array(self.cells, dtype=np.int64).reshape(-1, 2), distances=self.distances)
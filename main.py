@@ -37,5 +37,6 @@ from mazepathfinder import MazePathFinder
 # pF.displayPathOnGrid(maze,path)
 
 gridPF = MazePathFinder('assets/mazes/maze1.txt')
-path = gridPF.aStar(gridPF.start, gridPF.end, gridPF.structure)
-gridPF.displayPathOnGrid(gridPF.structure, path)
\ No newline at end of file
+result = gridPF.aStar(gridPF.start, gridPF.end, gridPF.structure)
+print("Total Manhattan distance for path:", result.cost)
+gridPF.displayPathOnGrid(gridPF.structure, result.path)
\ No newline at end of file
@@ -0,0 +1,203 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+import numpy as np
+import mapfile
+from connectivity import ConnectivityIndex
+from gridpathfinder import GridPathFinder
+from landmarks import LandmarkTable
+from mazepathfinder import MazePathFinder
+
+# A compiled map cache is a sidecar directory next to the map, <map>.mapcache, holding one .npy file per array
+# and meta.json. Arrays are memory-mapped copy-on-write on load, so setCell never writes back into the cache
+FORMAT_VERSION = 2  # 2: landmarks is the count asked for, landmarksBuilt the count the map had room for
+ENGINES = {'grid': GridPathFinder, 'maze': MazePathFinder}
+HASH_BLOCK = 1 << 20
+
+
+def sidecarPath(filePath, cacheDir=None):
+    directory = os.path.dirname(filePath) if cacheDir is None else cacheDir
+    return os.path.join(directory, os.path.basename(filePath) + '.mapcache')
+
+
+def hashFile(filePath):
+    digest = hashlib.sha256()
+    with open(filePath, 'rb') as file:
+        while block := file.read(HASH_BLOCK):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def readMeta(sidecar):
+    with open(os.path.join(sidecar, 'meta.json')) as file:
+        return json.load(file)
+
+
+def staleReason(meta, sourceHash, kind, landmarks):
+    # Why a sidecar can't be used for this load, None when it can
+    if meta.get('formatVersion') != FORMAT_VERSION:
+        return f"format version {meta.get('formatVersion')} is not {FORMAT_VERSION}"
+    if meta.get('sourceHash') != sourceHash:
+        return "source changed"
+    if kind is not None and meta.get('kind') != kind:
+        return f"cached as a {meta.get('kind')} map"
+    if meta.get('landmarks', 0) < landmarks:
+        # Compared with the count asked for, a map may have room for fewer landmarks than that
+        return f"built for {meta.get('landmarks', 0)} landmarks, {landmarks} wanted"
+    return None
+
+
+def readSource(filePath, kind):
+    # (kind, start, end, structure), binary maps stay memory-mapped
+    if mapfile.isBinaryMap(filePath):
+        header, structure = mapfile.loadBinary(filePath)
+        if kind is not None and header['kind'] != kind:
+            raise ValueError(f"File {filePath} holds a {header['kind']} map, not a {kind} map")
+        return header['kind'], header['start'], header['end'], structure
+    if kind is None:
+        raise ValueError(f"A kind is needed to load the CSV map {filePath}")
+    start, end, structure = mapfile.loadCsv(filePath)
+    return kind, start, end, structure
+
+
+def buildSidecar(filePath, sidecar, sourceHash, kind=None, landmarks=0):
+    # Compiles the map as a cold start would and writes everything derived from it, returns the path finder
+    startTime = time.perf_counter()
+    kind, start, end, structure = readSource(filePath, kind)
+    pathFinder = ENGINES[kind].fromStructure(structure, start, end)
+    pathFinder.buildConnectivity()
+    if landmarks:
+        pathFinder.buildLandmarks(landmarks)
+    buildSeconds = time.perf_counter() - startTime
+
+    arrays = {'moves': pathFinder.moves, 'labels': pathFinder.connectivity.labels}
+    if not mapfile.isBinaryMap(filePath):
+        arrays['structure'] = pathFinder.structure  # Binary maps are memory-mapped from the source instead
+    if landmarks:
+        arrays['landmarkCells'] = np.array(pathFinder.landmarks.cells, dtype=np.int64).reshape(-1, 2)
+        arrays['landmarkDistances'] = pathFinder.landmarks.distances
+    meta = {'formatVersion': FORMAT_VERSION, 'sourceHash': sourceHash, 'kind': kind, 'start': list(start),
+            'end': list(end), 'landmarks': landmarks, 'landmarksBuilt': len(pathFinder.landmarks.cells) if landmarks else 0,
+            'buildSeconds': buildSeconds, 'arrays': sorted(arrays)}
+
+    # Written to a private directory and renamed into place, so a concurrent load never sees half a cache
+    staging = f"{sidecar}.{os.getpid()}.tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    for name, values in arrays.items():
+        np.save(os.path.join(staging, name + '.npy'), np.ascontiguousarray(values))
+    with open(os.path.join(staging, 'meta.json'), 'w') as file:
+        json.dump(meta, file)
+    shutil.rmtree(sidecar, ignore_errors=True)
+    try:
+        os.rename(staging, sidecar)
+    except OSError:
+        shutil.rmtree(staging, ignore_errors=True)  # Another process put its cache in place first
+    return pathFinder, buildSeconds
+
+
+def openSidecar(filePath, sidecar, meta, landmarks=0):
+    def load(name):
+        return np.load(os.path.join(sidecar, name + '.npy'), mmap_mode='c')
+
+    kind = meta['kind']
+    if 'structure' in meta['arrays']:
+        structure = load('structure')
+    else:
+        structure = readSource(filePath, kind)[3]
+    pathFinder = ENGINES[kind].fromStructure(structure, tuple(meta['start']), tuple(meta['end']))
+    moves = load('moves')
+    if moves.shape != pathFinder.structure.shape:
+        raise ValueError(f"Cache {sidecar} doesn't match the shape of {filePath}")
+    pathFinder.moves = moves
+    pathFinder.connectivity = ConnectivityIndex.fromLabels(pathFinder.moves, load('labels'))
+    if landmarks:
+        # Farthest-point selection is incremental, so the first landmarks of a larger table are a valid table
+        pathFinder.landmarks = LandmarkTable(pathFinder.moves, load('landmarkCells')[:landmarks],
+                                             load('landmarkDistances')[:landmarks])
+    return pathFinder
+
+
+def loadCached(filePath, kind=None, landmarks=0, cacheDir=None, rebuild=False):
+    # Path finder of a map file with its moves, connectivity and optionally landmarks precomputed
+    # The first load writes the sidecar, later loads memory-map it while the source hash and format match
+    # pathFinder.cacheReport tells how the load went and how much startup time the cache saved
+    startTime = time.perf_counter()
+    sidecar = sidecarPath(filePath, cacheDir)
+    sourceHash = hashFile(filePath)
+    reason = "rebuild requested" if rebuild else None
+    if reason is None:
+        try:
+            meta = readMeta(sidecar)
+            reason = staleReason(meta, sourceHash, kind, landmarks)
+        except FileNotFoundError:
+            reason = "no cache"
+        except (OSError, ValueError) as error:
+            reason = f"unreadable cache: {error}"
+    if reason is None:
+        try:
+            pathFinder = openSidecar(filePath, sidecar, meta, landmarks)
+            loadSeconds = time.perf_counter() - startTime
+            pathFinder.cacheReport = {'status': 'hit', 'sidecar': sidecar, 'loadSeconds': loadSeconds,
+                                      'buildSeconds': meta['buildSeconds'],
+                                      'savedSeconds': meta['buildSeconds'] - loadSeconds}
+            return pathFinder
+        except (OSError, ValueError, KeyError) as error:
+            reason = f"unreadable cache: {error}"
+
+    pathFinder, buildSeconds = buildSidecar(filePath, sidecar, sourceHash, kind, landmarks)
+    pathFinder.cacheReport = {'status': 'built', 'reason': reason, 'sidecar': sidecar,
+                              'loadSeconds': time.perf_counter() - startTime, 'buildSeconds': buildSeconds,
+                              'savedSeconds': 0.0}
+    return pathFinder
+
+
+def invalidate(filePath, cacheDir=None):
+    # Removes the sidecar of a map, True if there was one
+    sidecar = sidecarPath(filePath, cacheDir)
+    if not os.path.exists(sidecar):
+        return False
+    shutil.rmtree(sidecar)
+    return True
+
+
+def cacheStatus(filePath, kind=None, landmarks=0, cacheDir=None):
+    sidecar = sidecarPath(filePath, cacheDir)
+    try:
+        meta = readMeta(sidecar)
+    except FileNotFoundError:
+        return {'sidecar': sidecar, 'fresh': False, 'reason': "no cache"}
+    except (OSError, ValueError) as error:
+        return {'sidecar': sidecar, 'fresh': False, 'reason': f"unreadable cache: {error}"}
+    reason = staleReason(meta, hashFile(filePath), kind, landmarks)
+    return {'sidecar': sidecar, 'fresh': reason is None, 'reason': reason, 'kind': meta.get('kind'),
+            'landmarks': meta.get('landmarks', 0), 'landmarksBuilt': meta.get('landmarksBuilt', 0),
+            'buildSeconds': meta.get('buildSeconds')}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Manage the compiled map caches that speed up loading maps")
+    parser.add_argument('command', choices=('build', 'rebuild', 'invalidate', 'status'),
+                        help="build loads through the cache, rebuild recompiles, invalidate deletes the cache")
+    parser.add_argument('maps', nargs='+', help="Binary maps, or CSV maps with --kind")
+    parser.add_argument('--kind', choices=mapfile.KINDS)
+    parser.add_argument('--landmarks', type=int, default=0, help="Landmarks to precompute for the alt mode")
+    parser.add_argument('--cache-dir', help="Keep the caches here instead of next to the maps")
+    args = parser.parse_args()
+
+    for mapPath in args.maps:
+        if args.command == 'invalidate':
+            removed = invalidate(mapPath, args.cache_dir)
+            print(f"{mapPath}: {'cache removed' if removed else 'no cache'}")
+        elif args.command == 'status':
+            status = cacheStatus(mapPath, args.kind, args.landmarks, args.cache_dir)
+            print(f"{mapPath}: {'fresh' if status['fresh'] else 'stale, ' + status['reason']} ({status['sidecar']})")
+        else:
+            report = loadCached(mapPath, args.kind, args.landmarks, args.cache_dir,
+                                rebuild=args.command == 'rebuild').cacheReport
+            print(f"{mapPath}: {report['status']}{', ' + report['reason'] if report.get('reason') else ''}, "
+                  f"loaded in {report['loadSeconds']:.3f}s, compiling takes {report['buildSeconds']:.3f}s, "
+                  f"saved {report['savedSeconds']:.3f}s")
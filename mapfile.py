@@ -0,0 +1,78 @@
+import argparse
+import struct
+import numpy as np
+
+# Binary map layout: a fixed 32 byte header followed by height * width cell bytes (row-major)
+MAGIC = b'NEAP'
+VERSION = 1
+HEADER = struct.Struct('<4sBB2x6I')  # magic, version, kind, padding, height, width, start row/col, end row/col
+KINDS = ('grid', 'maze')
+
+
+def isBinaryMap(filePath):
+    with open(filePath, 'rb') as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def readHeader(filePath):
+    with open(filePath, 'rb') as file:
+        data = file.read(HEADER.size)
+    if len(data) < HEADER.size:
+        raise ValueError(f"File {filePath} is too short to be a binary map.")
+
+    magic, version, kind, height, width, startRow, startCol, endRow, endCol = HEADER.unpack(data)
+    if magic != MAGIC:
+        raise ValueError(f"File {filePath} is not a binary map.")
+    if version != VERSION:
+        raise ValueError(f"Unsupported binary map version {version} in {filePath}.")
+    if kind >= len(KINDS):
+        raise ValueError(f"Unknown map kind {kind} in {filePath}.")
+
+    return {
+        'kind': KINDS[kind],
+        'height': height,
+        'width': width,
+        'start': (startRow, startCol),
+        'end': (endRow, endCol),
+    }
+
+
+def loadBinary(filePath, mode='c'):
+    # The default copy-on-write mode keeps the cells on disk until a page is modified in memory
+    header = readHeader(filePath)
+    structure = np.memmap(filePath, dtype=np.uint8, mode=mode, offset=HEADER.size,
+                          shape=(header['height'], header['width']))
+    return header, structure
+
+
+def saveBinary(filePath, kind, start, end, structure):
+    structure = np.ascontiguousarray(structure, dtype=np.uint8)
+    height, width = structure.shape
+    with open(filePath, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, KINDS.index(kind), height, width, *start, *end))
+        file.write(structure.tobytes())
+
+
+def loadCsv(filePath):
+    with open(filePath, 'r') as file:
+        lines = file.readlines()
+
+    start = tuple(map(int, lines[0].strip().split(',')))
+    end = tuple(map(int, lines[1].strip().split(',')))
+    structure = np.array([list(map(int, line.strip().split(','))) for line in lines[2:] if line.strip()], dtype=np.uint8)
+    return start, end, structure
+
+
+def convertCsv(csvPath, binaryPath, kind):
+    start, end, structure = loadCsv(csvPath)
+    saveBinary(binaryPath, kind, start, end, structure)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert a CSV map into the binary map format")
+    parser.add_argument('source', help="CSV map (start, end, then one row per line)")
+    parser.add_argument('target', help="Binary map to write")
+    parser.add_argument('--kind', choices=KINDS, required=True)
+    args = parser.parse_args()
+
+    convertCsv(args.source, args.target, args.kind)
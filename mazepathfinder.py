@@ -1,31 +1,64 @@
 from pathfinder import PathFinder
-from node import Node
+from moves import LEFT, RIGHT, UP, DOWN
+import numpy as np
+
+ONE_WAY_OUT = np.isin(np.arange(16), (LEFT, RIGHT, UP, DOWN))  # Masks with exactly one move
 
 class MazePathFinder(PathFinder):
-    def getNeighbour(self, node, maze):
-        neighbors = []
-        for newPos in [(0, -1), (0, 1), (-1, 0), (1, 0)]:  # Adjacent squares
-            nodePos = (node.pos[0] + newPos[0], node.pos[1] + newPos[1])
-            if nodePos[0] < 0 or nodePos[0] >= len(maze) or nodePos[1] < 0 or nodePos[1] >= len(maze[0]):
-                continue  # Node is out of bounds
-
-            # Check for walls
-            if newPos == (0, -1):  # Moving left
-                if maze[node.pos[0]][node.pos[1]] & 1:  # There's a left wall
-                    continue
-            elif newPos == (0, 1):  # Moving right
-                if nodePos[0] < len(maze) and maze[nodePos[0]][nodePos[1]] & 1:  # There's a left wall in the next cell
-                    continue
-            elif newPos == (-1, 0):  # Moving up
-                if maze[node.pos[0]][node.pos[1]] & 2:  # There's a top wall
-                    continue
-            elif newPos == (1, 0):  # Moving down
-                if nodePos[0] < len(maze) and maze[nodePos[0]][nodePos[1]] & 2:  # There's a top wall in the next cell
-                    continue
-
-            neighbors.append(Node(node, nodePos))
-        return neighbors
-
-    def generateStructure(self, start, end, height, width):
-        #* I need to implement this method
-        pass
\ No newline at end of file
+    kind = 'maze'
+
+    def compileMoves(self, maze):
+        # Bit 1 is a wall on the left of a cell and bit 2 a wall above it
+        openSides = ~maze & 3  # Bit 0 set when there is no left wall, bit 1 when there is no top wall
+        noLeftWall = openSides[:, 1:] & 1
+        noTopWall = openSides[1:, :] >> 1
+        moves = np.zeros(maze.shape, dtype=np.uint8)
+        moves[:, 1:] |= noLeftWall * np.uint8(LEFT)
+        moves[:, :-1] |= noLeftWall * np.uint8(RIGHT)  # Right wall is the next cell's left wall
+        moves[1:, :] |= noTopWall * np.uint8(UP)
+        moves[:-1, :] |= noTopWall * np.uint8(DOWN)  # Bottom wall is the next cell's top wall
+        return moves
+
+    def generateStructure(self, start, end, height, width, braid=0.0, seed=None):
+        # Perfect maze from the sidewinder algorithm, which works a row at a time and so vectorizes,
+        # then braid is the share of dead ends that get one extra wall knocked out to add loops
+        rng = np.random.default_rng(seed)
+        maze = np.full((height, width), 3, dtype=np.uint8)
+        maze[0, 1:] = 2  # The top row is one corridor
+
+        for top in range(1, height, self.generateRows):
+            block = maze[top:top + self.generateRows]
+            # Each row splits into runs, a run ends at random or at the right edge
+            closes = rng.random(block.shape, dtype=np.float32) < 0.5
+            closes[:, -1] = True
+            block[:, 1:][~closes[:, :-1]] &= ~np.uint8(1)  # Open the wall between cells of the same run
+
+            # Every run gets one opening upwards, at a random cell
+            runEnds = np.flatnonzero(closes.ravel())
+            runStarts = np.concatenate(([0], runEnds[:-1] + 1))
+            picks = runStarts + (rng.random(len(runStarts)) * (runEnds - runStarts + 1)).astype(np.int64)
+            block.ravel()[picks] &= ~np.uint8(2)
+
+        if braid > 0:
+            self.braidMaze(maze, braid, rng)
+        self.setStructure(maze)
+
+    def braidMaze(self, maze, braid, rng):
+        moves = self.compileMoves(maze)
+        deadEnds = np.flatnonzero(ONE_WAY_OUT[moves])
+        deadEnds = deadEnds[rng.random(len(deadEnds)) < braid]
+        rows, cols = np.divmod(deadEnds, maze.shape[1])
+
+        # Pick a random direction that is still walled off but stays inside the maze
+        height, width = maze.shape
+        inside = [cols > 0, cols < width - 1, rows > 0, rows < height - 1]
+        scores = np.stack([np.where(inside[index] & ((moves[rows, cols] & bit) == 0), rng.random(len(rows)), -1.0)
+                           for index, bit in enumerate((LEFT, RIGHT, UP, DOWN))])
+        choice = scores.argmax(axis=0)
+        valid = scores.max(axis=0) >= 0
+        rows, cols, choice = rows[valid], cols[valid], choice[valid]
+
+        # The left and top walls belong to the cell, the right and bottom ones to its neighbour
+        for index, (dr, dc, wall) in enumerate(((0, 0, 1), (0, 1, 1), (0, 0, 2), (1, 0, 2))):
+            chosen = choice == index
+            maze[rows[chosen] + dr, cols[chosen] + dc] &= ~np.uint8(wall)
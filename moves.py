@@ -0,0 +1,36 @@
+import hashlib
+import numpy as np
+
+# Directions in the order the neighbour generators try them, with the bit each one uses in a move mask
+LEFT, RIGHT, UP, DOWN = 1, 2, 4, 8
+DIRECTIONS = [((0, -1), LEFT), ((0, 1), RIGHT), ((-1, 0), UP), ((1, 0), DOWN)]
+OPPOSITE = {LEFT: RIGHT, RIGHT: LEFT, UP: DOWN, DOWN: UP}
+
+# Steps allowed by each of the 16 possible masks, so an expansion is one table lookup
+MASK_STEPS = [tuple(step for step, bit in DIRECTIONS if mask & bit) for mask in range(16)]
+
+
+def flatSteps(width):
+    # MASK_STEPS as flat cell id offsets
+    return [tuple(dr * width + dc for dr, dc in steps) for steps in MASK_STEPS]
+
+
+def flatOffsets(width):
+    # Flat cell id offset for each direction, in DIRECTIONS order
+    return [dr * width + dc for (dr, dc), bit in DIRECTIONS]
+
+
+
+def reverseMoves(moves):
+    # Bit d is set when the neighbour in direction d can step into the cell, so searches can run backwards
+    reverse = np.zeros_like(moves)
+    reverse[:, 1:] |= np.where(moves[:, :-1] & RIGHT, LEFT, 0).astype(np.uint8)
+    reverse[:, :-1] |= np.where(moves[:, 1:] & LEFT, RIGHT, 0).astype(np.uint8)
+    reverse[1:, :] |= np.where(moves[:-1, :] & DOWN, UP, 0).astype(np.uint8)
+    reverse[:-1, :] |= np.where(moves[1:, :] & UP, DOWN, 0).astype(np.uint8)
+    return reverse
+
+
+def hashMoves(moves):
+    # Identifies the moves a saved abstraction or landmark table was built for
+    return hashlib.sha1(np.ascontiguousarray(moves).tobytes() + repr(moves.shape).encode()).hexdigest()
@@ -2,6 +2,8 @@ import heapq
 import math
 
 class Node:
+    __slots__ = ('parent', 'pos', 'g', 'h', 'f')
+
     def __init__(self, parent=None, pos=None):
         self.parent = parent
         self.pos = pos
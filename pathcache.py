@@ -0,0 +1,97 @@
+from array import array
+from collections import OrderedDict
+
+
+class PathCache:
+    # LRU cache of search results keyed by (structure version, start, end), bounded by the cells of the cached paths
+    # Any stretch of a cached optimal path is itself optimal, so paths also answer queries between their own cells
+    # Paths are kept as arrays of flat cell ids (row * width + col), so a cached cell costs an array slot and an index entry
+    def __init__(self, maxCells=1 << 20, width=0):
+        self.maxCells = maxCells
+        self.width = width
+        self.entries = OrderedDict()  # key -> array of cell ids, None for a cached unreachable query
+        self.cells = 0  # Cells of every cached path, an unreachable query counts as one
+        self.pathsThrough = {}  # cell id -> key of the cached path through it, or a list of keys when there are several
+        self.hits = 0
+        self.subpathHits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def toCells(self, ids):
+        return [divmod(cell, self.width) for cell in ids]
+
+    def lookup(self, version, start, end):
+        # Returns (found, path), path may be None for a cached unreachable query
+        key = (version, start, end)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            ids = self.entries[key]
+            return True, (self.toCells(ids) if ids is not None else None)
+
+        startId = start[0] * self.width + start[1]
+        endId = end[0] * self.width + end[1]
+        through = self.pathsThrough.get(startId, ())
+        for candidate in (through if isinstance(through, list) else [through] if through else ()):
+            if candidate[0] != version:
+                continue
+            ids = self.entries[candidate]
+            first = ids.index(startId)
+            try:
+                last = ids.index(endId, first)
+            except ValueError:
+                continue
+            self.entries.move_to_end(candidate)
+            self.hits += 1
+            self.subpathHits += 1
+            return True, self.toCells(ids[first:last + 1])
+
+        self.misses += 1
+        return False, None
+
+    def store(self, version, start, end, path):
+        key = (version, start, end)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return
+        size = len(path) if path is not None else 1
+        if size > self.maxCells:
+            return  # Would evict everything else and still not fit
+
+        ids = array('l', [row * self.width + col for row, col in path]) if path is not None else None
+        self.entries[key] = ids
+        self.cells += size
+        for cell in ids or ():
+            through = self.pathsThrough.get(cell)
+            if through is None:
+                self.pathsThrough[cell] = key
+            elif isinstance(through, list):
+                through.append(key)
+            else:
+                self.pathsThrough[cell] = [through, key]
+
+        while self.cells > self.maxCells:
+            self.evict(next(iter(self.entries)))
+
+    def evict(self, key):
+        ids = self.entries.pop(key)
+        self.cells -= len(ids) if ids is not None else 1
+        for cell in ids or ():
+            through = self.pathsThrough[cell]
+            if isinstance(through, list):
+                through.remove(key)
+                if len(through) == 1:
+                    self.pathsThrough[cell] = through[0]
+            else:
+                del self.pathsThrough[cell]
+
+    def clear(self):
+        self.entries.clear()
+        self.pathsThrough.clear()
+        self.cells = 0
+
+    def stats(self):
+        return {'size': len(self.entries), 'cells': self.cells, 'maxCells': self.maxCells, 'hits': self.hits,
+                'subpathHits': self.subpathHits, 'misses': self.misses}
@@ -1,88 +1,664 @@
 from node import Node
+from array import array
+from multiprocessing import shared_memory
 import math
 import heapq
+import multiprocessing
+import os
+import sys
+import itertools
+import time
+import weakref
 import numpy as np
+import mapfile
+import renderer
+from distancefield import DistanceField
+from hierarchical import ClusterAbstraction
+from pathcache import PathCache
+from moves import DIRECTIONS, MASK_STEPS, OPPOSITE, flatSteps, reverseMoves
+from dstarlite import DStarLite
+from connectivity import ConnectivityIndex
+from landmarks import LandmarkTable
+from searchstats import SearchResult, SearchCounters
+
+# Every structure and every change to one gets a new version, so cached results can't outlive them
+structureVersions = itertools.count()
 
 
 class PathFinder:
-    def __init__(self, *args):
+    kind = None  # Map kind stored in binary map headers, set by subclasses
+    generateRows = 1024  # Rows generated per block, bounds the temporary memory of generateStructure
+    maxDistanceFields = 16  # Goals whose distance fields stay cached
+    pathCache = None  # PathCache once enableCache is called
+    connectivity = None  # ConnectivityIndex once buildConnectivity is called
+    searchStats = None  # Counters of the last search, {'expanded': ..., 'pushes': ..., 'peakOpen': ...}
+    counters = None  # SearchCounters once enableCounters is called
+    traceHook = None  # Called as traceHook(pos, g) for every expanded cell when set
+    exactHeuristicTargets = 32  # Multi-target searches with more targets use a bounding box heuristic
+    cacheReport = None  # How mapcache.loadCached produced this path finder and the startup time it saved
+
+    def __init__(self, *args, **options):
+        # Keyword options (seed, density, ...) are passed on to generateStructure
         if len(args) == 1 and isinstance(args[0], str):
             self.loadFile(args[0])
-        elif len(args) == 4 and all(isinstance(arg, int) for arg in args):
-            self.start, self.end, height, width = args
-            self.generateStructure(self.start,self.end,height, width)
+        elif len(args) == 4 and all(isinstance(arg, int) for arg in args[2:]):
+            self.start, self.end, height, width = tuple(args[0]), tuple(args[1]), args[2], args[3]
+            self.generateStructure(self.start, self.end, height, width, **options)
         else:
-            raise ValueError("Must provide either a file path or height and width")
+            raise ValueError("Must provide either a file path or start, end, height and width")
         
+    @classmethod
+    def fromStructure(cls, structure, start=None, end=None):
+        pathFinder = cls.__new__(cls)
+        pathFinder.start, pathFinder.end = start, end
+        pathFinder.setStructure(structure)
+        return pathFinder
+
     def manhattanDist(self, a, b):
         return abs(a[0] - b[0]) + abs(a[1] - b[1])
 
-    def displayPathOnGrid(self, grid, path):
-        for i in range(len(grid)):
-            for j in range(len(grid[0])):
-                if (i, j) in path:
-                    print(' X', end='')
-                else:
-                    print(' -', end='')
-            print()  # Newline after each row
+    def displayPathOnGrid(self, grid, path, stream=None):
+        renderer.renderText(grid, path, self.kind, stream)
+
+    def saveImage(self, filePath, path=None, maxSize=2048):
+        # PNG or PPM picture of the structure and a path, downsampled so the longer side fits in maxSize
+        renderer.saveImage(filePath, self.structure, path, self.kind, maxSize)
 
     def aStar(self, start, end, grid):
-        startNode = Node(None, start)
-        endNode = Node(None, end)
+        return self.runSearch('astar', lambda: self.searchPath(start, end, grid))
 
-        openList = []
-        closedList = []
+    def search(self, start=None, end=None, mode='astar', **options):
+        # findPath with what the search cost, as a SearchResult
+        return self.runSearch(mode, lambda: self.findPath(start, end, mode, **options))
 
-        count = 0  # Counter for tie-breaking
-        heapq.heappush(openList, (startNode.f, count, startNode))  # Add the start node
+    def runSearch(self, mode, search):
+        self.searchStats = None  # Stays None when the query is answered without searching
+        startTime = time.perf_counter()
+        path = search()
+        result = SearchResult(path, mode, time.perf_counter() - startTime, self.searchStats)
+        if self.counters is not None:
+            self.counters.record(result)
+        return result
+
+    def enableCounters(self):
+        self.counters = SearchCounters()
+        return self.counters
+
+    def searchPath(self, start, end, grid):
+        # Same search as aStar without writing to stdout, answered from the path cache when one is enabled
+        if self.isUnreachable(start, end, grid):
+            return None
+        useCache = self.pathCache is not None and grid is self.structure
+        if useCache:
+            found, path = self.pathCache.lookup(self.version, tuple(start), tuple(end))
+            if found:
+                return path
+
+        path = self.aStarSearch(start, end, grid)
+        if useCache:
+            self.pathCache.store(self.version, tuple(start), tuple(end), path)
+        return path
+
+    def aStarSearch(self, start, end, grid, weight=1, heuristic=None):
+        # weight > 1 inflates the heuristic, the path found then costs at most weight times the optimum
+        # heuristic(cellId) replaces the Manhattan distance to end when given
+        height, width = grid.shape
+        startId = start[0] * width + start[1]
+        endId = end[0] * width + end[1]
+        endRow, endCol = end
+
+        # Search state is indexed by flat cell id (row * width + col), parallel arrays replace Node objects
+        closed = bytearray(height * width)  # 1 once a cell has been expanded
+        bestG = array('l', [sys.maxsize]) * (height * width)  # Lowest g pushed so far per cell
+        parents = array('l', [-1]) * (height * width)  # Cell the best g was reached from
+        bestG[startId] = 0
+        moves = self.movesFor(grid).data.cast('B')  # Flat view of the move masks, no copy
+        steps = flatSteps(width)
+
+        openList = []
+        count = 0  # Counter for tie-breaking, also counts the pushes after the start node
+        expanded = 0
+        peakOpen = 1
+        trace = self.traceHook
+        heapq.heappush(openList, (0, count, startId))  # Add the start node
 
         while len(openList) > 0:
-            currentNode = heapq.heappop(openList)[2]  # Node with the lowest f value
-            closedList.append(currentNode)
+            currentId = heapq.heappop(openList)[2]  # Cell with the lowest f value
+            if closed[currentId]:
+                continue  # Stale entry, the cell was already expanded with a lower g
+            closed[currentId] = 1
+            expanded += 1
+            if trace is not None:
+                trace(divmod(currentId, width), bestG[currentId])
 
-            if currentNode == endNode:  # Found the goal
+            if currentId == endId:  # Found the goal
+                self.searchStats = {'expanded': expanded, 'pushes': count + 1, 'peakOpen': peakOpen, 'bound': weight}
                 path = []
-                while currentNode is not None:
-                    path.append(currentNode.pos)
-                    currentNode = currentNode.parent
-                path = path[::-1]  # Reverse the path
+                while currentId != -1:
+                    path.append(divmod(currentId, width))
+                    currentId = parents[currentId]
+                return path[::-1]  # Reverse the path
 
-                # Calculate the Manhattan distances for the final path
-                manhattanDistTotal = sum(self.manhattanDist(path[i], path[i+1]) for i in range(len(path) - 1))
+            g = bestG[currentId] + 1  # A popped cell's first entry always carries its best g
+            for step in steps[moves[currentId]]:  # One table lookup gives every allowed move
+                childId = currentId + step
+                if closed[childId]:
+                    continue  # Child is already in the closed list
+                if g >= bestG[childId]:
+                    continue  # Child is already in the open list with a lower or equal g value
+                bestG[childId] = g
+                parents[childId] = currentId
+                if heuristic is None:
+                    row, col = divmod(childId, width)
+                    h = abs(row - endRow) + abs(col - endCol)
+                else:
+                    h = heuristic(childId)
 
-                print("Total Manhattan distance for path:", manhattanDistTotal)
+                count += 1  # Increment counter
+                heapq.heappush(openList, (g + weight * h, count, childId))  # Add the child to the open list
 
+            if len(openList) > peakOpen:
+                peakOpen = len(openList)
 
-                return path
+        self.searchStats = {'expanded': expanded, 'pushes': count + 1, 'peakOpen': peakOpen, 'bound': weight}
 
-            children = self.getNeighbour(currentNode, grid)
-            for child in children:
-                if child in closedList:
-                    continue  # Child is already in the closed list
-                child.g = currentNode.g + 1
-                child.h = self.manhattanDist(child.pos, endNode.pos)
-                child.f = child.g + child.h
+    def weightedSearch(self, start, end, grid, epsilon=1.5):
+        # Bounded-suboptimal A*, expands far fewer cells than aStarSearch on open maps
+        if epsilon < 1:
+            raise ValueError("epsilon must be at least 1")
+        if self.isUnreachable(start, end, grid):
+            return None
+        return self.aStarSearch(start, end, grid, epsilon)
 
-                if any(openNode for openNode in openList if child == openNode[2] and child.g > openNode[2].g):
-                    continue  # Child is already in the open list and has a higher g value
+    def anytimeSearch(self, start, end, grid, timeLimit=0.1, epsilon=3.0, decrement=0.5, onImprove=None):
+        # ARA*: weighted A* with a falling epsilon that reuses the previous search's g values each round
+        # The first path is always searched for in full, after that the rounds stop at the deadline and the
+        # best path so far is returned with the bound it is known to meet, onImprove(path, bound) sees each one
+        if epsilon < 1:
+            raise ValueError("epsilon must be at least 1")
+        if self.isUnreachable(start, end, grid):
+            return None
+        deadline = time.perf_counter() + timeLimit
+        height, width = grid.shape
+        startId = start[0] * width + start[1]
+        endId = end[0] * width + end[1]
+        endRow, endCol = end
 
-                count += 1  # Increment counter
-                heapq.heappush(openList, (child.f, count, child))  # Add the child to the open list          
-    
+        def heuristic(cell):
+            row, col = divmod(cell, width)
+            return abs(row - endRow) + abs(col - endCol)
+
+        bestG = array('l', [sys.maxsize]) * (height * width)
+        parents = array('l', [-1]) * (height * width)
+        inOpen = bytearray(height * width)
+        bestG[startId] = 0
+        moves = self.movesFor(grid).data.cast('B')
+        steps = flatSteps(width)
+
+        openList = [(epsilon * heuristic(startId), 0, startId)]
+        inOpen[startId] = 1
+        trace = self.traceHook
+        inconsistent = set()  # Cells improved after their expansion this round, reopened in the next one
+        count = 0
+        expanded = 0
+        peakOpen = 1
+        rounds = 0
+        path, bound = None, None
+        while True:
+            rounds += 1
+            closed = bytearray(height * width)
+            timedOut = False
+            while openList:
+                f, _, currentId = openList[0]
+                if not inOpen[currentId] or f != bestG[currentId] + epsilon * heuristic(currentId):
+                    heapq.heappop(openList)  # Stale entry
+                    continue
+                if f >= bestG[endId]:
+                    break  # No open cell can improve the path to the goal at this epsilon
+                if path is not None and expanded % 1024 == 0 and time.perf_counter() > deadline:
+                    timedOut = True
+                    break
+                heapq.heappop(openList)
+                inOpen[currentId] = 0
+                closed[currentId] = 1
+                expanded += 1
+                if trace is not None:
+                    trace(divmod(currentId, width), bestG[currentId])
+
+                g = bestG[currentId] + 1
+                for step in steps[moves[currentId]]:
+                    childId = currentId + step
+                    if g >= bestG[childId]:
+                        continue
+                    bestG[childId] = g
+                    parents[childId] = currentId
+                    if closed[childId]:
+                        inconsistent.add(childId)
+                    else:
+                        inOpen[childId] = 1
+                        count += 1
+                        heapq.heappush(openList, (g + epsilon * heuristic(childId), count, childId))
+                if len(openList) > peakOpen:
+                    peakOpen = len(openList)
+
+            if timedOut:
+                break
+            if bestG[endId] == sys.maxsize:
+                break  # The goal can't be reached
+
+            # Every cell still open or inconsistent bounds the optimum from below, which can tighten the bound
+            pending = {cell for _, _, cell in openList if inOpen[cell]} | inconsistent
+            lowest = min((bestG[cell] + heuristic(cell) for cell in pending), default=bestG[endId])
+            bound = min(epsilon, bestG[endId] / lowest) if lowest else 1.0
+            path = []
+            cell = endId
+            while cell != -1:
+                path.append(divmod(cell, width))
+                cell = parents[cell]
+            path.reverse()
+            if onImprove is not None:
+                onImprove(list(path), bound)
+            if bound <= 1 or time.perf_counter() > deadline:
+                break
+
+            # Next round with a smaller epsilon, never above the bound already proven, with the open list rebuilt
+            epsilon = max(1.0, min(epsilon - decrement, bound))
+            for cell in inconsistent:
+                inOpen[cell] = 1
+            openList = [(bestG[cell] + epsilon * heuristic(cell), 0, cell) for cell in pending]
+            heapq.heapify(openList)
+            inconsistent = set()
+
+        self.searchStats = {'expanded': expanded, 'pushes': count + 1, 'peakOpen': peakOpen, 'bound': bound,
+                            'rounds': rounds}
+        return path
+
+    def findNearest(self, start=None, targets=(), k=1):
+        # Paths to the k targets nearest to start, nearest first, from a single search
+        start = tuple(self.start if start is None else start)
+        return self.multiTargetSearch(start, [tuple(target) for target in targets], self.structure, k)
+
+    def searchNearest(self, start=None, targets=(), k=1):
+        # findNearest with what the search cost, as (paths, SearchResult), the result's path is the nearest one
+        paths = []
+
+        def search():
+            paths.extend(self.findNearest(start, targets, k))
+            return paths[0] if paths else None
+        return paths, self.runSearch('nearest', search)
+
+    def multiTargetSearch(self, start, targets, grid, k=1):
+        # A* towards a set of cells with a heuristic that never overestimates the distance to the nearest one:
+        # the exact minimum Manhattan distance for a few targets, the distance to their bounding box for many
+        # Goals have h = 0 and the heuristic is consistent, so they are reached in order of their distance
+        if self.connectivity is not None and grid is self.structure:
+            targets = [target for target in targets if self.connectivity.canReach(start, target)]
+        if not targets or k < 1:
+            return []
+        height, width = grid.shape
+        goals = {row * width + col for row, col in targets}
+        if len(goals) <= self.exactHeuristicTargets:
+            targetCells = [divmod(goal, width) for goal in goals]
+
+            def heuristic(row, col):
+                return min(abs(row - targetRow) + abs(col - targetCol) for targetRow, targetCol in targetCells)
+        else:
+            top, bottom = min(row for row, _ in targets), max(row for row, _ in targets)
+            left, right = min(col for _, col in targets), max(col for _, col in targets)
+
+            def heuristic(row, col):
+                return max(top - row, 0, row - bottom) + max(left - col, 0, col - right)
+
+        startId = start[0] * width + start[1]
+        closed = bytearray(height * width)
+        bestG = array('l', [sys.maxsize]) * (height * width)
+        parents = array('l', [-1]) * (height * width)
+        bestG[startId] = 0
+        moves = self.movesFor(grid).data.cast('B')
+        steps = flatSteps(width)
+
+        openList = [(heuristic(*start), 0, startId)]
+        count = 0
+        expanded = 0
+        peakOpen = 1
+        trace = self.traceHook
+        paths = []
+        while openList:
+            currentId = heapq.heappop(openList)[2]
+            if closed[currentId]:
+                continue  # Stale entry
+            closed[currentId] = 1
+            expanded += 1
+            if trace is not None:
+                trace(divmod(currentId, width), bestG[currentId])
+
+            if currentId in goals:
+                path = []
+                cell = currentId
+                while cell != -1:
+                    path.append(divmod(cell, width))
+                    cell = parents[cell]
+                paths.append(path[::-1])
+                if len(paths) == k or len(paths) == len(goals):
+                    break
+
+            g = bestG[currentId] + 1
+            for step in steps[moves[currentId]]:
+                childId = currentId + step
+                if closed[childId] or g >= bestG[childId]:
+                    continue
+                bestG[childId] = g
+                parents[childId] = currentId
+                count += 1
+                heapq.heappush(openList, (g + heuristic(*divmod(childId, width)), count, childId))
+            if len(openList) > peakOpen:
+                peakOpen = len(openList)
+
+        self.searchStats = {'expanded': expanded, 'pushes': count + 1, 'peakOpen': peakOpen, 'bound': 1}
+        return paths
+
+    def bidirectionalSearch(self, start, end, grid):
+        # Forward search from start and backward search from end, each guided towards the other's origin
+        start, end = tuple(start), tuple(end)
+        if start == end:
+            return [start]
+        if self.isUnreachable(start, end, grid):
+            return None
+        height, width = grid.shape
+        startId = start[0] * width + start[1]
+        endId = end[0] * width + end[1]
+
+        # Index 0 is the forward search, index 1 the backward one
+        closed = [bytearray(height * width), bytearray(height * width)]
+        bestG = [array('l', [sys.maxsize]) * (height * width), array('l', [sys.maxsize]) * (height * width)]
+        parents = [{startId: None}, {endId: None}]
+        openLists = [[(self.manhattanDist(start, end), 0, startId)], [(self.manhattanDist(end, start), 0, endId)]]
+        targets = [end, start]
+        forwardMoves = self.movesFor(grid)
+        masks = [forwardMoves.data.cast('B'), reverseMoves(forwardMoves).data.cast('B')]  # Reverse masks list who can step in
+        steps = flatSteps(width)
+        bestG[0][startId] = 0
+        bestG[1][endId] = 0
+
+        count = 0  # Counter for tie-breaking
+        expanded = 0
+        peakOpen = 2
+        trace = self.traceHook
+        bestCost = sys.maxsize  # Cheapest start to end path seen where the two searches touch
+        meeting = None
+        while True:
+            for side in (0, 1):
+                while openLists[side] and closed[side][openLists[side][0][2]]:
+                    heapq.heappop(openLists[side])  # Stale entry
+            if not openLists[0] or not openLists[1]:
+                break
+            # Neither search can find a cheaper path once either frontier's lowest f reaches the best cost
+            if max(openLists[0][0][0], openLists[1][0][0]) >= bestCost:
+                break
 
-    def generateStructure(self, start, end, height, width):
+            side = 0 if len(openLists[0]) <= len(openLists[1]) else 1  # Grow the smaller frontier
+            currentId = heapq.heappop(openLists[side])[2]
+            closed[side][currentId] = 1
+            expanded += 1
+            if trace is not None:
+                trace(divmod(currentId, width), bestG[side][currentId])
+
+            for step in steps[masks[side][currentId]]:
+                childId = currentId + step
+                if closed[side][childId]:
+                    continue
+                g = bestG[side][currentId] + 1
+                if g >= bestG[side][childId]:
+                    continue
+                bestG[side][childId] = g
+                parents[side][childId] = currentId
+                count += 1
+                heapq.heappush(openLists[side], (g + self.manhattanDist(divmod(childId, width), targets[side]), count, childId))
+
+                if bestG[1 - side][childId] != sys.maxsize and g + bestG[1 - side][childId] < bestCost:
+                    bestCost = g + bestG[1 - side][childId]
+                    meeting = childId
+
+            if len(openLists[0]) + len(openLists[1]) > peakOpen:
+                peakOpen = len(openLists[0]) + len(openLists[1])
+
+        self.searchStats = {'expanded': expanded, 'pushes': count + 2, 'peakOpen': peakOpen}
+        if meeting is None:
+            return None
+        path = []
+        cell = meeting
+        while cell is not None:
+            path.append(divmod(cell, width))
+            cell = parents[0][cell]
+        path.reverse()
+        cell = parents[1][meeting]
+        while cell is not None:
+            path.append(divmod(cell, width))
+            cell = parents[1][cell]
+        return path
+
+    def findPaths(self, queries, workers=None, chunkSize=None):
+        # Answers many (start, end) queries against self.structure, results are in query order
+        queries = [(tuple(start), tuple(end)) for start, end in queries]
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers <= 1 or len(queries) <= 1:
+            return [self.searchPath(start, end, self.structure) for start, end in queries]
+
+        if self.pathCache is not None or self.connectivity is not None:
+            # Only the queries the cache and the connectivity index can't answer go to the pool
+            results = [self.answerLocally(start, end) for start, end in queries]
+            pending = [query for query, (found, _) in zip(queries, results) if not found]
+            solved = iter(self.findPathsInPool(pending, workers, chunkSize) if pending else [])
+            paths = []
+            for query, (found, path) in zip(queries, results):
+                if not found:
+                    path = next(solved)
+                    if self.pathCache is not None:
+                        self.pathCache.store(self.version, *query, path)
+                paths.append(path)
+            return paths
+
+        return self.findPathsInPool(queries, workers, chunkSize)
+
+    def answerLocally(self, start, end):
+        # (found, path) from the connectivity index or the path cache, without searching
+        if self.isUnreachable(start, end, self.structure):
+            return True, None
+        if self.pathCache is not None:
+            return self.pathCache.lookup(self.version, start, end)
+        return False, None
+
+    def findPathsInPool(self, queries, workers, chunkSize=None):
+        if chunkSize is None:
+            chunkSize = max(1, math.ceil(len(queries) / (workers * 4)))  # A few chunks per worker evens out slow queries
+
+        # Workers attach to one shared copy of the structure instead of receiving it pickled
+        sharedStructure = shared_memory.SharedMemory(create=True, size=max(self.structure.nbytes, 1))
+        try:
+            sharedArray = np.ndarray(self.structure.shape, dtype=np.uint8, buffer=sharedStructure.buf)
+            sharedArray[:] = self.structure
+            del sharedArray  # The buffer can't be closed while a view on it exists
+
+            initArgs = (type(self), sharedStructure.name, self.structure.shape)
+            with multiprocessing.Pool(workers, initializer=initWorker, initargs=initArgs) as pool:
+                return pool.map(findPathWorker, queries, chunkSize)
+        finally:
+            sharedStructure.close()
+            sharedStructure.unlink()
+
+    def enableCache(self, maxCells=1 << 20):
+        # Bounded by the cells of the cached paths, about 100 bytes each
+        self.pathCache = PathCache(maxCells, self.width)
+        return self.pathCache
+
+    def disableCache(self):
+        self.pathCache = None
+
+    def setCell(self, pos, value):
+        # Supported way to change the structure, anything derived from the old cells is refreshed or dropped
+        pos = tuple(pos)
+        self.structure[pos] = value
+        self.version = next(structureVersions)
+        if self.moves is not None:
+            row, col = pos
+            top, left = max(row - 2, 0), max(col - 2, 0)
+            before = self.moves[top:row + 3, left:col + 3].copy()
+            self.refreshMoves(pos)
+            if self.connectivity is not None:
+                self.connectivity.movesChanged(top, left, before, self.moves[top:row + 3, left:col + 3])
+        self.distanceFields.clear()
+        self.hierarchy = None
+        self.landmarks = None
+        self.jumpTables = None
+        if self.pathCache is not None:
+            self.pathCache.clear()
+        for replanner in self.replanners:
+            replanner.cellChanged(pos)
+
+    def refreshMoves(self, pos):
+        # Only the cell and its four neighbours can change, compiling a window two cells wide gives them full context
+        row, col = pos
+        top, left = max(row - 2, 0), max(col - 2, 0)
+        window = self.compileMoves(self.structure[top:row + 3, left:col + 3])
+        rowStart, colStart = max(row - 1, 0), max(col - 1, 0)
+        rowEnd, colEnd = min(row + 2, self.height), min(col + 2, self.width)
+        self.moves[rowStart:rowEnd, colStart:colEnd] = window[rowStart - top:rowEnd - top, colStart - left:colEnd - left]
+
+    def buildConnectivity(self):
+        # Component labels that let searches reject unreachable queries without exploring anything
+        self.connectivity = ConnectivityIndex(self.getMoves())
+        return self.connectivity
+
+    def isUnreachable(self, start, end, grid):
+        return self.connectivity is not None and grid is self.structure and not self.connectivity.canReach(start, end)
+
+    def replanner(self, start, goal):
+        # Incremental planner that repairs its search after setCell instead of starting over
+        return DStarLite(self, start, goal)
+
+    def getMoves(self):
+        if self.moves is None:
+            self.moves = self.compileMoves(self.structure)
+        return self.moves
+
+    def movesFor(self, grid):
+        # Masks for the loaded structure are compiled once, any other grid is compiled on the spot
+        return self.getMoves() if grid is self.structure else self.compileMoves(grid)
+
+    def distanceField(self, goal):
+        goal = tuple(goal)
+        field = self.distanceFields.pop(goal, None)
+        if field is None:
+            field = DistanceField(self.getMoves(), goal)
+            if len(self.distanceFields) >= self.maxDistanceFields:
+                del self.distanceFields[next(iter(self.distanceFields))]  # Drop the least recently used goal
+        self.distanceFields[goal] = field  # Reinserting keeps the dict in recently used order
+        return field
+
+    def pathFromField(self, start, goal):
+        return self.distanceField(goal).pathFrom(start)
+
+    def buildHierarchy(self, clusterSize=16):
+        self.hierarchy = ClusterAbstraction.build(self.getMoves(), clusterSize)
+        return self.hierarchy
+
+    def loadHierarchy(self, filePath):
+        self.hierarchy = ClusterAbstraction.load(filePath, self.getMoves())
+        return self.hierarchy
+
+    def hierarchicalPath(self, start, end):
+        # Near-optimal path through the cluster abstraction, built with default settings on first use
+        if self.isUnreachable(start, end, self.structure):
+            return None
+        if self.hierarchy is None:
+            self.buildHierarchy()
+        path = self.hierarchy.findPath(start, end)
+        self.searchStats = self.hierarchy.searchStats
+        return path
+
+    def buildLandmarks(self, count=8, seed=0):
+        self.landmarks = LandmarkTable.build(self.getMoves(), count, seed)
+        return self.landmarks
+
+    def loadLandmarks(self, filePath):
+        self.landmarks = LandmarkTable.load(filePath, self.getMoves())
+        return self.landmarks
+
+    def altSearch(self, start, end, grid):
+        # Optimal A* guided by landmark distances, built with default settings on first use
+        if self.isUnreachable(start, end, grid):
+            return None
+        if grid is not self.structure:
+            return self.aStarSearch(start, end, grid)
+        if self.landmarks is None:
+            self.buildLandmarks()
+        return self.aStarSearch(start, end, grid, heuristic=self.landmarks.heuristicTo(end))
+
+    def generateStructure(self, start, end, height, width, **options):
+        raise NotImplementedError("This method should be overridden in a subclass")
+
+    def compileMoves(self, structure):
         raise NotImplementedError("This method should be overridden in a subclass")
 
     def getNeighbour(self, node, grid):
-        raise NotImplementedError("This method should be overridden in a subclass")  
+        # Shared by grids and mazes, the subclass rules are already baked into the compiled move masks
+        row, col = node.pos
+        return [Node(node, (row + dr, col + dc)) for dr, dc in MASK_STEPS[self.movesFor(grid)[row, col]]]
 
-    def findPath(self):
-        raise NotImplementedError("This method should be overridden in a subclass")
+    def getReverseNeighbour(self, node, grid):
+        # Cells that can step into node, found from the neighbours' own masks
+        row, col = node.pos
+        moves = self.movesFor(grid)
+        neighbors = []
+        for (dr, dc), bit in DIRECTIONS:
+            neighbourRow, neighbourCol = row + dr, col + dc
+            if 0 <= neighbourRow < moves.shape[0] and 0 <= neighbourCol < moves.shape[1]:
+                if moves[neighbourRow, neighbourCol] & OPPOSITE[bit]:
+                    neighbors.append(Node(node, (neighbourRow, neighbourCol)))
+        return neighbors
+
+    def endpoints(self, start, end):
+        # Queries default to the start and end loaded with the structure
+        return tuple(self.start if start is None else start), tuple(self.end if end is None else end)
+
+    def findPath(self, start=None, end=None, mode='astar', **options):
+        # options go to the weighted (epsilon) and anytime (timeLimit, epsilon, ...) searches
+        start, end = self.endpoints(start, end)
+        if mode == 'astar':
+            return self.searchPath(start, end, self.structure)
+        if mode == 'bidirectional':
+            return self.bidirectionalSearch(start, end, self.structure)
+        if mode == 'weighted':
+            return self.weightedSearch(start, end, self.structure, **options)
+        if mode == 'anytime':
+            return self.anytimeSearch(start, end, self.structure, **options)
+        if mode == 'alt':
+            return self.altSearch(start, end, self.structure)
+        if mode == 'hierarchical':
+            return self.hierarchicalPath(start, end)
+        raise ValueError(f"Unknown search mode {mode}")
+
+    def setStructure(self, structure):
+        # Structure is a 2D uint8 array, one byte per cell
+        self.structure = np.ascontiguousarray(structure, dtype=np.uint8)
+        if self.structure.ndim != 2:
+            raise ValueError("Structure must be a 2D array")
+        self.height, self.width = self.structure.shape
+        self.version = next(structureVersions)
+        self.moves = None  # Compiled lazily by getMoves
+        self.distanceFields = {}
+        self.hierarchy = None
+        self.landmarks = None  # LandmarkTable for the alt mode
+        self.jumpTables = None  # JumpTables for the jps mode of grids
+        self.replanners = weakref.WeakSet()  # DStarLite planners told about setCell changes
+        self.connectivity = None
+        if self.pathCache is not None:
+            self.enableCache(self.pathCache.maxCells)  # Cached cell ids depend on the width
 
     def loadFile(self, filePath):
         try:
-            with open(filePath, 'r') as file:
-                lines = file.readlines()
+            binary = mapfile.isBinaryMap(filePath)
         except FileNotFoundError:
             print(f"File {filePath} not found.")
             return
@@ -90,19 +666,43 @@ class PathFinder:
             print(f"Permission denied for file {filePath}.")
             return
 
-        try:
-            # Parse start and end positions
-            self.start = tuple(map(int, lines[0].strip().split(',')))
-            self.end = tuple(map(int, lines[1].strip().split(',')))
+        if binary:
+            self.loadBinaryFile(filePath)
+        else:
+            self.loadCsvFile(filePath)
+
+    def loadBinaryFile(self, filePath):
+        header, structure = mapfile.loadBinary(filePath)
+        if self.kind is not None and header['kind'] != self.kind:
+            raise ValueError(f"File {filePath} holds a {header['kind']} map, not a {self.kind} map")
 
-            # Parse structure
-            self.structure = [list(map(int, line.strip().split(','))) for line in lines[2:]]
+        self.start = header['start']
+        self.end = header['end']
+        self.setStructure(structure)  # Stays memory-mapped, cells are paged in on first access
 
-            # Infer height and width from structure
-            self.height = len(self.structure)
-            self.width = len(self.structure[0]) if self.structure else 0
+    def loadCsvFile(self, filePath):
+        try:
+            self.start, self.end, structure = mapfile.loadCsv(filePath)
+            self.setStructure(structure)
         except (IndexError, ValueError):
             print(f"Error parsing file {filePath}. Check that it's in the correct format.")
 
+    def saveFile(self, filePath):
+        mapfile.saveBinary(filePath, self.kind, self.start, self.end, self.structure)
+
+
+# Per-process state for findPaths workers
+workerPathFinder = None
+workerSharedStructure = None
+
+
+def initWorker(cls, sharedName, shape):
+    global workerPathFinder, workerSharedStructure
+    workerSharedStructure = shared_memory.SharedMemory(name=sharedName)
+    structure = np.ndarray(shape, dtype=np.uint8, buffer=workerSharedStructure.buf)
+    workerPathFinder = cls.fromStructure(structure)
 
 
+def findPathWorker(query):
+    start, end = query
+    return workerPathFinder.searchPath(start, end, workerPathFinder.structure)
@@ -0,0 +1,169 @@
+import math
+import struct
+import sys
+import zlib
+import numpy as np
+
+# Pixel codes, higher codes win when a block of pixels is downsampled into one
+FREE, PATH, START, END = 0, 1, 2, 3
+PATH_COLOURS = np.array([[0, 0, 0], [220, 30, 30], [30, 170, 30], [30, 60, 220]], dtype=np.uint8)
+
+
+def cellRowBlocks(height, blockRows):
+    for top in range(0, height, blockRows):
+        yield top, min(top + blockRows, height)
+
+
+def pathCells(path):
+    return np.array(path, dtype=np.int64).reshape(-1, 2)
+
+
+def renderText(structure, path=None, kind='grid', stream=None, blockRows=256):
+    # Builds the text a block of rows at a time in one array and writes each block with a single call
+    stream = stream or sys.stdout
+    cells = pathCells(path or [])
+    render = renderMazeText if kind == 'maze' else renderGridText
+    for top, bottom in cellRowBlocks(structure.shape[0], blockRows):
+        inBlock = (cells[:, 0] >= top) & (cells[:, 0] < bottom)
+        stream.write(render(structure, top, bottom, cells[inBlock]).tobytes().decode('ascii'))
+    stream.flush()
+
+
+def renderGridText(grid, top, bottom, cells):
+    # Two characters per cell, ' #' for an obstacle, ' X' on the path and ' -' otherwise
+    rows = grid[top:bottom]
+    canvas = np.full((bottom - top, 2 * grid.shape[1] + 1), ord(' '), dtype=np.uint8)
+    symbols = np.where(rows != 0, ord('#'), ord('-')).astype(np.uint8)
+    symbols[cells[:, 0] - top, cells[:, 1]] = ord('X')
+    canvas[:, 1:-1:2] = symbols
+    canvas[:, -1] = ord('\n')
+    return canvas
+
+
+def renderMazeText(maze, top, bottom, cells):
+    # Each cell is a wall line and a cell line three characters wide, bit 1 is a left wall and bit 2 a top wall
+    rows = maze[top:bottom]
+    height, width = rows.shape
+    lastBlock = bottom == maze.shape[0]
+    canvas = np.full((2 * height + lastBlock, 3 * width + 2), ord(' '), dtype=np.uint8)
+    canvas[0:2 * height:2, 0:-1:3] = ord('+')
+    for offset in (1, 2):
+        canvas[0:2 * height:2, offset:-1:3] = np.where(rows & 2, ord('-'), ord(' '))
+    canvas[1:2 * height:2, 0:-2:3] = np.where(rows & 1, ord('|'), ord(' '))
+    canvas[1:2 * height:2, -2] = ord('|')  # Right border
+    if lastBlock:
+        canvas[-1, :-1] = ord('-')
+        canvas[-1, 0:-1:3] = ord('+')
+    canvas[2 * (cells[:, 0] - top) + 1, 3 * cells[:, 1] + 2] = ord('X')
+    canvas[:, -1] = ord('\n')
+    return canvas
+
+
+def imageSize(shape, kind):
+    # Mazes get a pixel per cell and per wall between cells, grids a pixel per cell
+    height, width = shape
+    return (2 * height + 1, 2 * width + 1) if kind == 'maze' else (height, width)
+
+
+def pathPixels(path, kind):
+    # (rows, cols, codes) of the path in full resolution pixels
+    cells = pathCells(path or [])
+    codes = np.full(len(cells), PATH, dtype=np.uint8)
+    if len(cells):
+        codes[0], codes[-1] = START, END
+    if kind != 'maze':
+        return cells[:, 0], cells[:, 1], codes
+    pixels = 2 * cells + 1
+    gaps = cells[:-1] + cells[1:] + 1  # The opening between two consecutive cells of the path
+    pixels = np.concatenate([gaps, pixels])
+    codes = np.concatenate([np.full(len(gaps), PATH, dtype=np.uint8), codes])
+    return pixels[:, 0], pixels[:, 1], codes
+
+
+def wallPixels(structure, kind, top, bottom):
+    # Full resolution wall pixels of cell rows top to bottom, True for a wall or an obstacle
+    rows = structure[top:bottom]
+    if kind != 'maze':
+        return rows != 0
+    height, width = rows.shape
+    lastBlock = bottom == structure.shape[0]
+    walls = np.zeros((2 * height + lastBlock, 2 * width + 1), dtype=bool)
+    walls[0:2 * height:2, 0::2] = True  # Corners
+    walls[0:2 * height:2, 1::2] = (rows & 2) != 0
+    walls[1:2 * height:2, 0:-1:2] = (rows & 1) != 0
+    walls[1:2 * height:2, -1] = True  # Right border
+    if lastBlock:
+        walls[-1] = True
+    return walls
+
+
+def blockReduce(pixels, factor, reduce):
+    # Pads to whole blocks by repeating the edge, then reduces every factor x factor block
+    height, width = pixels.shape
+    padded = np.pad(pixels, ((0, -height % factor), (0, -width % factor)), mode='edge')
+    blocks = padded.reshape(padded.shape[0] // factor, factor, padded.shape[1] // factor, factor)
+    return reduce(blocks, axis=(1, 3))
+
+
+def imageRows(structure, path=None, kind='grid', factor=1, blockRows=256):
+    # Yields RGB rows of the image, walls are dark and a downsampled block is shaded by its share of walls
+    rows, cols, codes = pathPixels(path, kind)
+    pixelRowsPerCell = 2 if kind == 'maze' else 1
+    cellRows = factor * max(1, blockRows // factor)  # Keeps every block a whole number of downsampled rows
+    for top, bottom in cellRowBlocks(structure.shape[0], cellRows):
+        walls = wallPixels(structure, kind, top, bottom)
+        pixelTop = pixelRowsPerCell * top
+        marks = np.zeros(walls.shape, dtype=np.uint8)
+        inBlock = (rows >= pixelTop) & (rows < pixelTop + walls.shape[0])
+        np.maximum.at(marks, (rows[inBlock] - pixelTop, cols[inBlock]), codes[inBlock])
+
+        shade = 255 - np.rint(blockReduce(walls, factor, np.mean) * 255).astype(np.uint8)
+        marks = blockReduce(marks, factor, np.max)
+        image = np.repeat(shade[:, :, np.newaxis], 3, axis=2)
+        image[marks != FREE] = PATH_COLOURS[marks[marks != FREE]]
+        yield image
+
+
+def downsampleFactor(shape, kind, maxSize):
+    return max(1, math.ceil(max(imageSize(shape, kind)) / maxSize)) if maxSize else 1
+
+
+def savePpm(filePath, structure, path=None, kind='grid', maxSize=2048):
+    factor = downsampleFactor(structure.shape, kind, maxSize)
+    height, width = (math.ceil(size / factor) for size in imageSize(structure.shape, kind))
+    with open(filePath, 'wb') as file:
+        file.write(b'P6\n%d %d\n255\n' % (width, height))
+        for image in imageRows(structure, path, kind, factor):
+            file.write(image.tobytes())
+
+
+def pngChunk(chunkType, data):
+    return struct.pack('>I', len(data)) + chunkType + data + struct.pack('>I', zlib.crc32(chunkType + data))
+
+
+def savePng(filePath, structure, path=None, kind='grid', maxSize=2048):
+    # Written with zlib directly, one IDAT chunk per block of rows
+    factor = downsampleFactor(structure.shape, kind, maxSize)
+    height, width = (math.ceil(size / factor) for size in imageSize(structure.shape, kind))
+    compressor = zlib.compressobj(6)
+    with open(filePath, 'wb') as file:
+        file.write(b'\x89PNG\r\n\x1a\n')
+        file.write(pngChunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)))
+        for image in imageRows(structure, path, kind, factor):
+            scanlines = np.zeros((image.shape[0], 3 * width + 1), dtype=np.uint8)  # Filter byte 0 on every row
+            scanlines[:, 1:] = image.reshape(image.shape[0], -1)
+            data = compressor.compress(scanlines.tobytes())
+            if data:
+                file.write(pngChunk(b'IDAT', data))
+        file.write(pngChunk(b'IDAT', compressor.flush()))
+        file.write(pngChunk(b'IEND', b''))
+
+
+def saveImage(filePath, structure, path=None, kind='grid', maxSize=2048):
+    # maxSize caps the longer side of the image, larger maps are downsampled to fit
+    if filePath.lower().endswith('.png'):
+        savePng(filePath, structure, path, kind, maxSize)
+    elif filePath.lower().endswith('.ppm'):
+        savePpm(filePath, structure, path, kind, maxSize)
+    else:
+        raise ValueError(f"Unsupported image format: {filePath}")
@@ -0,0 +1,61 @@
+class SearchResult:
+    # Path of one query with what the search cost, a query answered without searching has zero counters
+    def __init__(self, path, mode, elapsed, stats=None):
+        stats = stats or {}
+        self.path = path
+        self.mode = mode
+        self.elapsed = elapsed  # Seconds
+        self.expanded = stats.get('expanded', 0)
+        self.generated = stats.get('pushes', 0)  # Nodes pushed onto the open list
+        self.peakOpen = stats.get('peakOpen', 0)
+        self.bound = stats.get('bound')  # Proven cost / optimum limit of the A* family, 1 for an optimal search
+        self.scanned = stats.get('scanned', 0)  # Jump table lookups of a jump point search, work the expansions hide
+
+    @property
+    def found(self):
+        return self.path is not None
+
+    @property
+    def cost(self):
+        # Every move costs 1, so the cost is the number of steps
+        return len(self.path) - 1 if self.path is not None else None
+
+    def asDict(self):
+        return {'mode': self.mode, 'found': self.found, 'cost': self.cost, 'expanded': self.expanded,
+                'generated': self.generated, 'peakOpen': self.peakOpen, 'bound': self.bound,
+                'scanned': self.scanned, 'elapsed': self.elapsed}
+
+    def __repr__(self):
+        return (f"SearchResult(mode={self.mode!r}, cost={self.cost}, expanded={self.expanded}, "
+                f"generated={self.generated}, peakOpen={self.peakOpen}, bound={self.bound}, elapsed={self.elapsed:.6f})")
+
+
+class SearchCounters:
+    # Running totals over every SearchResult recorded, for scraping into metrics
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.searches = 0
+        self.found = 0
+        self.expanded = 0
+        self.generated = 0
+        self.scanned = 0
+        self.peakOpen = 0  # Largest open list of any search
+        self.elapsed = 0.0
+        self.modes = {}  # mode -> searches
+
+    def record(self, result):
+        self.searches += 1
+        self.found += result.found
+        self.expanded += result.expanded
+        self.generated += result.generated
+        self.scanned += result.scanned
+        self.peakOpen = max(self.peakOpen, result.peakOpen)
+        self.elapsed += result.elapsed
+        self.modes[result.mode] = self.modes.get(result.mode, 0) + 1
+
+    def snapshot(self):
+        return {'searches': self.searches, 'found': self.found, 'expanded': self.expanded,
+                'generated': self.generated, 'scanned': self.scanned, 'peakOpen': self.peakOpen,
+                'elapsed': self.elapsed, 'modes': dict(self.modes)}
@@ -0,0 +1,239 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import mapcache
+import mapfile
+from gridpathfinder import GridPathFinder
+from mazepathfinder import MazePathFinder
+from searchstats import SearchResult, SearchCounters
+
+ENGINES = {'grid': GridPathFinder, 'maze': MazePathFinder}
+
+
+def parseMapSpec(spec):
+    # name=path for binary maps, which store their kind, or name=kind:path for any map file
+    name, separator, location = spec.partition('=')
+    if not separator or not name:
+        raise ValueError(f"Map {spec} should be name=path or name=kind:path")
+    kind, separator, filePath = location.partition(':')
+    if not separator or kind not in ENGINES:
+        kind, filePath = None, location
+    return name, kind, filePath
+
+
+def loadMap(kind, filePath, cache=False):
+    if cache:
+        return mapcache.loadCached(filePath, kind)  # Compiled once, every later load memory-maps the sidecar
+    if kind is None:
+        if not os.path.exists(filePath) or not mapfile.isBinaryMap(filePath):
+            raise ValueError(f"No kind given for {filePath}, which isn't a binary map")
+        kind = mapfile.readHeader(filePath)['kind']
+    pathFinder = ENGINES[kind](filePath)
+    if getattr(pathFinder, 'structure', None) is None:
+        raise ValueError(f"Could not load map {filePath}")
+    return pathFinder
+
+
+# Per-process maps of the search workers, every map is memory-mapped from a binary map or a map cache,
+# so the workers share its pages with the server
+workerMaps = {}
+
+
+def initServerWorker(mapSpecs, cache=False):
+    for name, (kind, filePath) in mapSpecs.items():
+        workerMaps[name] = loadMap(kind, filePath, cache)
+
+
+def serverSearch(name, start, end, mode, options):
+    pathFinder = workerMaps[name]
+    result = pathFinder.search(start, end, mode, **options)
+    return result.path, result.elapsed, pathFinder.searchStats
+
+
+class PathServer:
+    # Answers newline-delimited JSON queries against maps that stay loaded in the worker processes
+    # A query is {"map": name, "start": [row, col], "end": [row, col], "mode": ..., "options": {...}, "id": ...},
+    # {"command": "metrics"} and {"command": "maps"} report on the server itself
+    latencyWindow = 4096  # Recent request latencies kept for the percentiles
+
+    def __init__(self, mapSpecs, workers=None, cache=False):
+        self.mapSpecs = dict(mapSpecs)  # name -> (kind, filePath)
+        self.cache = cache  # Load maps through their compiled map caches, the server writes any that are missing
+        self.mapDirectory = None  # Binary copies of the CSV maps, removed with the server
+        self.maps = {}
+        for name, (kind, filePath) in self.mapSpecs.items():
+            self.maps[name] = loadMap(kind, filePath, cache)
+            if not cache and not mapfile.isBinaryMap(filePath):
+                # Parsed once here, the server and its workers then memory-map the same pages of a binary copy
+                if self.mapDirectory is None:
+                    self.mapDirectory = tempfile.TemporaryDirectory(prefix='pathserver-')
+                binaryPath = os.path.join(self.mapDirectory.name, f"{len(self.maps)}.neap")
+                self.maps[name].saveFile(binaryPath)
+                self.mapSpecs[name] = (None, binaryPath)
+                self.maps[name] = loadMap(None, binaryPath)
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = None
+        self.inFlight = {}  # Query key -> future of the search every identical request waits on
+        self.counters = SearchCounters()
+        self.latencies = deque(maxlen=self.latencyWindow)
+        self.requests = 0
+        self.merged = 0
+        self.errors = 0
+        self.startTime = time.perf_counter()
+
+    def start(self):
+        # Workers come from a fork server, a plain fork on the first search would inherit the listening and
+        # client sockets, and a client would never see its connection close while any worker held a copy
+        self.executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('forkserver'),
+                                            initializer=initServerWorker, initargs=(self.mapSpecs, self.cache))
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+    def queryKey(self, query):
+        name = query.get('map')
+        if name not in self.maps:
+            raise ValueError(f"Unknown map {name}")
+        pathFinder = self.maps[name]
+        start, end = pathFinder.endpoints(query.get('start'), query.get('end'))
+        for row, col in (start, end):
+            if not (0 <= row < pathFinder.height and 0 <= col < pathFinder.width):
+                raise ValueError(f"Cell {(row, col)} is outside map {name}")
+        options = query.get('options') or {}
+        return name, start, end, query.get('mode', 'astar'), tuple(sorted(options.items()))
+
+    async def search(self, key):
+        future = self.inFlight.get(key)
+        if future is not None:
+            self.merged += 1
+            return await asyncio.shield(future)
+
+        name, start, end, mode, options = key
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, serverSearch, name, start, end, mode, dict(options))
+        self.inFlight[key] = future
+        try:
+            path, elapsed, stats = await asyncio.shield(future)
+        finally:
+            del self.inFlight[key]
+        self.counters.record(SearchResult(path, mode, elapsed, stats))
+        return path, elapsed, stats
+
+    async def answer(self, query):
+        command = query.get('command')
+        if command == 'metrics':
+            return self.metrics()
+        if command == 'maps':
+            return {'maps': {name: {'kind': pathFinder.kind, 'height': pathFinder.height, 'width': pathFinder.width,
+                                    'cache': pathFinder.cacheReport}
+                             for name, pathFinder in self.maps.items()}}
+        if command is not None:
+            raise ValueError(f"Unknown command {command}")
+
+        path, elapsed, stats = await self.search(self.queryKey(query))
+        result = SearchResult(path, query.get('mode', 'astar'), elapsed, stats)
+        response = result.asDict()
+        response['path'] = path
+        return response
+
+    async def handleRequest(self, line):
+        startTime = time.perf_counter()
+        self.requests += 1
+        query = {}
+        try:
+            query = json.loads(line)
+            if not isinstance(query, dict):
+                raise ValueError("A query must be a JSON object")
+            response = await self.answer(query)
+        except Exception as error:  # Reported to the client, one bad query must not take the server down
+            self.errors += 1
+            response = {'error': str(error)}
+        if 'id' in query:
+            response['id'] = query['id']
+        self.latencies.append(time.perf_counter() - startTime)
+        return response
+
+    async def handleConnection(self, reader, writer):
+        # Requests on one connection are answered as they finish, the id field pairs them up
+        lock = asyncio.Lock()
+
+        async def respond(line):
+            response = await self.handleRequest(line)
+            async with lock:
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+
+        tasks = set()
+        try:
+            while line := await reader.readline():
+                if line.strip():
+                    task = asyncio.create_task(respond(line))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def metrics(self):
+        uptime = time.perf_counter() - self.startTime
+        latencies = sorted(self.latencies)
+
+        def percentile(share):
+            return latencies[min(len(latencies) - 1, int(share * len(latencies)))] if latencies else None
+
+        return {
+            'uptime': uptime,
+            'requests': self.requests,
+            'errors': self.errors,
+            'merged': self.merged,
+            'inFlight': len(self.inFlight),
+            'throughput': self.requests / uptime if uptime else 0.0,
+            'latency': {'p50': percentile(0.5), 'p95': percentile(0.95), 'p99': percentile(0.99),
+                        'max': latencies[-1] if latencies else None},
+            'searches': self.counters.snapshot(),
+        }
+
+    async def serve(self, host='127.0.0.1', port=8765, socketPath=None):
+        self.start()
+        try:
+            if socketPath is not None:
+                server = await asyncio.start_unix_server(self.handleConnection, socketPath)
+            else:
+                server = await asyncio.start_server(self.handleConnection, host, port)
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve path queries over maps kept in memory")
+    parser.add_argument('maps', nargs='+', help="name=path for binary maps, name=kind:path otherwise")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--socket', help="Listen on this Unix socket instead of TCP")
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--cache', action='store_true', help="Load maps through compiled map caches")
+    args = parser.parse_args()
+
+    specs = {}
+    for spec in args.maps:
+        name, kind, filePath = parseMapSpec(spec)
+        specs[name] = (kind, filePath)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)  # Stop like Ctrl+C so the worker pool shuts down
+    try:
+        asyncio.run(PathServer(specs, args.workers, args.cache).serve(args.host, args.port, args.socket))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,347 @@
+import argparse
+import heapq
+import struct
+import sys
+import time
+from bisect import bisect_left, bisect_right
+import numpy as np
+import mapfile
+from gridpathfinder import GridPathFinder
+from moves import DIRECTIONS
+from node import Node
+from searchstats import SearchResult
+
+# Sparse grid layout: a fixed 40 byte header, the obstacle run count of every row (uint32), then the start column
+# and the length of every run (uint32 each), runs sorted by row and then by column
+MAGIC = b'NEAS'
+VERSION = 1
+HEADER = struct.Struct('<4sB3x6IQ')  # magic, version, padding, height, width, start row/col, end row/col, run count
+
+
+class RunLengthGrid:
+    # Obstacles of a grid as per-row runs of blocked cells, memory follows the number of runs and not the area
+    # Runs are kept in CSR form: the runs of row r are starts/ends[offsets[r]:offsets[r + 1]], ends inclusive
+    bandRows = 1024  # Rows converted at a time by fromDense
+
+    def __init__(self, height, width, offsets, starts, ends):
+        self.height, self.width = height, width
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.starts = np.asarray(starts, dtype=np.uint32)
+        self.ends = np.asarray(ends, dtype=np.uint32)
+        self.rows = {}  # row -> (starts, ends) as lists for bisect, filled as searches touch rows
+
+    @classmethod
+    def fromDense(cls, structure):
+        height, width = structure.shape
+        counts, starts, ends = [], [], []
+        for top in range(0, height, cls.bandRows):
+            blocked = np.pad(structure[top:top + cls.bandRows] != 0, ((0, 0), (1, 1)))
+            changes = np.diff(blocked.view(np.int8), axis=1)
+            runRows, runStarts = np.nonzero(changes == 1)
+            runEnds = np.nonzero(changes == -1)[1] - 1
+            counts.append(np.bincount(runRows, minlength=blocked.shape[0]))
+            starts.append(runStarts)
+            ends.append(runEnds)
+        offsets = np.concatenate([[0], np.cumsum(np.concatenate(counts))]) if counts else np.zeros(1, dtype=np.int64)
+        return cls(height, width, offsets, np.concatenate(starts) if starts else [],
+                   np.concatenate(ends) if ends else [])
+
+    def toDense(self, top=0, bottom=None):
+        # Cells of rows top to bottom as a uint8 array, 1 for an obstacle
+        bottom = self.height if bottom is None else bottom
+        dense = np.zeros((bottom - top, self.width + 1), dtype=np.int8)
+        first, last = self.offsets[top], self.offsets[bottom]
+        runRows = np.repeat(np.arange(bottom - top), np.diff(self.offsets[top:bottom + 1]))
+        np.add.at(dense, (runRows, self.starts[first:last].astype(np.int64)), 1)
+        np.add.at(dense, (runRows, self.ends[first:last].astype(np.int64) + 1), -1)
+        return np.cumsum(dense, axis=1)[:, :-1].astype(np.uint8)
+
+    @property
+    def runCount(self):
+        return len(self.starts)
+
+    def rowRuns(self, row):
+        runs = self.rows.get(row)
+        if runs is None:
+            first, last = self.offsets[row], self.offsets[row + 1]
+            runs = self.rows[row] = (self.starts[first:last].tolist(), self.ends[first:last].tolist())
+        return runs
+
+    def isBlocked(self, row, col):
+        if not (0 <= row < self.height and 0 <= col < self.width):
+            return True  # Outside the map counts as blocked, like the padding of the dense searches
+        starts, ends = self.rowRuns(row)
+        index = bisect_right(starts, col) - 1
+        return index >= 0 and ends[index] >= col
+
+    def openSpan(self, row, col):
+        # (left, right) columns of the open run holding col, inclusive, or None on an obstacle
+        starts, ends = self.rowRuns(row)
+        index = bisect_right(starts, col) - 1
+        if index >= 0 and ends[index] >= col:
+            return None
+        left = ends[index] + 1 if index >= 0 else 0
+        right = starts[index + 1] - 1 if index + 1 < len(starts) else self.width - 1
+        return left, right
+
+    def nextOpening(self, row, col):
+        # Smallest column c > col where row opens up again after an obstacle, c - 1 blocked and c open
+        if not 0 <= row < self.height:
+            return None
+        starts, ends = self.rowRuns(row)
+        index = bisect_left(ends, col)
+        if index < len(ends) and ends[index] + 1 < self.width:
+            return ends[index] + 1
+        return None
+
+    def previousOpening(self, row, col):
+        # Largest column c < col where row opens up just before an obstacle, c + 1 blocked and c open
+        if not 0 <= row < self.height:
+            return None
+        starts, ends = self.rowRuns(row)
+        index = bisect_right(starts, col) - 1
+        if index >= 0 and starts[index] > 0:
+            return starts[index] - 1
+        return None
+
+
+def saveSparse(filePath, start, end, grid):
+    with open(filePath, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, grid.height, grid.width, *start, *end, grid.runCount))
+        file.write(np.diff(grid.offsets).astype('<u4').tobytes())
+        file.write(grid.starts.astype('<u4').tobytes())
+        file.write((grid.ends - grid.starts + 1).astype('<u4').tobytes())
+
+
+def loadSparse(filePath):
+    with open(filePath, 'rb') as file:
+        data = file.read(HEADER.size)
+        if len(data) < HEADER.size:
+            raise ValueError(f"File {filePath} is too short to be a sparse grid.")
+        magic, version, height, width, startRow, startCol, endRow, endCol, runCount = HEADER.unpack(data)
+        if magic != MAGIC:
+            raise ValueError(f"File {filePath} is not a sparse grid.")
+        if version != VERSION:
+            raise ValueError(f"Unsupported sparse grid version {version} in {filePath}.")
+        counts = np.fromfile(file, dtype='<u4', count=height)
+        starts = np.fromfile(file, dtype='<u4', count=runCount)
+        lengths = np.fromfile(file, dtype='<u4', count=runCount)
+    if len(counts) != height or len(lengths) != runCount:
+        raise ValueError(f"File {filePath} is truncated.")
+    offsets = np.concatenate([[0], np.cumsum(counts, dtype=np.int64)])
+    grid = RunLengthGrid(height, width, offsets, starts, starts + lengths - 1)
+    return (startRow, startCol), (endRow, endCol), grid
+
+
+def convertToSparse(source, target):
+    # Binary grids are converted through their memory map, CSV grids are read whole
+    if mapfile.isBinaryMap(source):
+        header, structure = mapfile.loadBinary(source, mode='r')
+        if header['kind'] != 'grid':
+            raise ValueError(f"File {source} holds a {header['kind']} map, only grids can be stored sparsely")
+        start, end = header['start'], header['end']
+    else:
+        start, end, structure = mapfile.loadCsv(source)
+    saveSparse(target, start, end, RunLengthGrid.fromDense(structure))
+
+
+class SparseGridPathFinder:
+    # GridPathFinder semantics over a RunLengthGrid: moves go into walkable cells inside the map
+    # Jump point search skips whole open runs with one bisect per row instead of stepping cell by cell
+    kind = 'grid'
+
+    def __init__(self, filePath=None, grid=None, start=None, end=None):
+        if filePath is not None:
+            start, end, grid = loadSparse(filePath)
+        if grid is None:
+            raise ValueError("Must provide either a file path or a RunLengthGrid")
+        self.grid = grid
+        self.start, self.end = start, end
+        self.height, self.width = grid.height, grid.width
+        self.searchStats = None
+
+    @classmethod
+    def fromStructure(cls, structure, start=None, end=None):
+        return cls(grid=RunLengthGrid.fromDense(structure), start=start, end=end)
+
+    def toPathFinder(self):
+        # Dense GridPathFinder of the same map, for the modes only the dense engine has
+        return GridPathFinder.fromStructure(self.grid.toDense(), self.start, self.end)
+
+    def saveFile(self, filePath):
+        saveSparse(filePath, self.start, self.end, self.grid)
+
+    def getNeighbour(self, node, grid=None):
+        row, col = node.pos
+        return [Node(node, (row + dr, col + dc)) for (dr, dc), _ in DIRECTIONS
+                if not self.grid.isBlocked(row + dr, col + dc)]
+
+    def findPath(self, start=None, end=None, mode='jps'):
+        start = tuple(self.start if start is None else start)
+        end = tuple(self.end if end is None else end)
+        if mode == 'jps':
+            return self.jumpPointSearch(start, end)
+        if mode == 'astar':
+            return self.aStarSearch(start, end)
+        raise ValueError(f"Unknown search mode {mode}")
+
+    def search(self, start=None, end=None, mode='jps'):
+        self.searchStats = None
+        startTime = time.perf_counter()
+        path = self.findPath(start, end, mode)
+        return SearchResult(path, mode, time.perf_counter() - startTime, self.searchStats)
+
+    def aStarSearch(self, start, end):
+        isBlocked = self.grid.isBlocked
+        endRow, endCol = end
+        bestG = {start: 0}
+        parents = {start: None}
+        closed = set()
+        openList = [(0, 0, start)]
+        count = 0
+        expanded = 0
+        peakOpen = 1
+        while openList:
+            current = heapq.heappop(openList)[2]
+            if current in closed:
+                continue  # Stale entry
+            closed.add(current)
+            expanded += 1
+            if current == end:
+                break
+
+            row, col = current
+            g = bestG[current] + 1
+            for (dr, dc), _ in DIRECTIONS:
+                child = (row + dr, col + dc)
+                if child in closed or g >= bestG.get(child, sys.maxsize) or isBlocked(*child):
+                    continue
+                bestG[child] = g
+                parents[child] = current
+                count += 1
+                heapq.heappush(openList, (g + abs(child[0] - endRow) + abs(child[1] - endCol), count, child))
+            if len(openList) > peakOpen:
+                peakOpen = len(openList)
+
+        self.searchStats = {'expanded': expanded, 'pushes': count + 1, 'peakOpen': peakOpen, 'bound': 1}
+        return self.tracePath(parents, end) if end in closed else None
+
+    @staticmethod
+    def tracePath(parents, cell):
+        path = []
+        while cell is not None:
+            path.append(cell)
+            cell = parents[cell]
+        return path[::-1]
+
+    def jumpPointSearch(self, start, end):
+        # Same jump rules as GridPathFinder.jumpPointSearch, the forced neighbours of a horizontal run are the
+        # openings of the rows above and below, so one bisect per row finds the next one
+        grid = self.grid
+        isBlocked = grid.isBlocked
+        endRow, endCol = end
+
+        def jumpHorizontal(row, col, step):
+            if isBlocked(row, col + step):
+                return None
+            span = grid.openSpan(row, col + step)
+            if step > 0:
+                stops = [span[1] + 1]  # Past the end of the run, a dead end unless something comes first
+                if row == endRow and col < endCol <= span[1]:
+                    stops.append(endCol)
+                for neighbourRow in (row - 1, row + 1):
+                    opening = grid.nextOpening(neighbourRow, col)
+                    if opening is not None:
+                        stops.append(opening)
+                stop = min(stops)
+                return None if stop > span[1] else stop
+            stops = [span[0] - 1]
+            if row == endRow and span[0] <= endCol < col:
+                stops.append(endCol)
+            for neighbourRow in (row - 1, row + 1):
+                opening = grid.previousOpening(neighbourRow, col)
+                if opening is not None:
+                    stops.append(opening)
+            stop = max(stops)
+            return None if stop < span[0] else stop
+
+        def jumpVertical(row, col, step):
+            while True:
+                row += step
+                if isBlocked(row, col):
+                    return None
+                if (row, col) == end or jumpHorizontal(row, col, -1) is not None or jumpHorizontal(row, col, 1) is not None:
+                    return row
+
+        openList = []
+        count = 0
+        expanded = 0
+        peakOpen = 1
+        bestG = {start: 0}
+        parents = {start: None}
+        closed = set()
+        heapq.heappush(openList, (abs(start[0] - endRow) + abs(start[1] - endCol), count, start, (0, 0)))
+
+        while openList:
+            _, _, cell, arrival = heapq.heappop(openList)
+            if cell in closed:
+                continue  # Stale entry
+            closed.add(cell)
+            expanded += 1
+
+            if cell == end:
+                self.searchStats = {'expanded': expanded, 'pushes': count + 1, 'peakOpen': peakOpen}
+                jumpPoints = self.tracePath(parents, cell)
+                # Fill in the straight runs between consecutive jump points
+                path = [jumpPoints[0]]
+                for (row, col), (nextRow, nextCol) in zip(jumpPoints, jumpPoints[1:]):
+                    dr = (nextRow > row) - (nextRow < row)
+                    dc = (nextCol > col) - (nextCol < col)
+                    while (row, col) != (nextRow, nextCol):
+                        row, col = row + dr, col + dc
+                        path.append((row, col))
+                return path
+
+            row, col = cell
+            if arrival == (0, 0):  # Start cell, try every direction
+                steps = [(0, -1), (0, 1), (-1, 0), (1, 0)]
+            elif arrival[0] == 0:  # Arrived horizontally, keep going and turn only into forced neighbours
+                steps = [arrival]
+                for vertical in (-1, 1):
+                    if not isBlocked(row + vertical, col) and isBlocked(row + vertical, col - arrival[1]):
+                        steps.append((vertical, 0))
+            else:  # Arrived vertically, keep going and branch both ways horizontally
+                steps = [arrival, (0, -1), (0, 1)]
+
+            for dr, dc in steps:
+                if dr == 0:
+                    jumpCol = jumpHorizontal(row, col, dc)
+                    jumpPoint = None if jumpCol is None else (row, jumpCol)
+                else:
+                    jumpRow = jumpVertical(row, col, dr)
+                    jumpPoint = None if jumpRow is None else (jumpRow, col)
+                if jumpPoint is None or jumpPoint in closed:
+                    continue
+
+                g = bestG[cell] + abs(jumpPoint[0] - row) + abs(jumpPoint[1] - col)
+                if g >= bestG.get(jumpPoint, sys.maxsize):
+                    continue
+                bestG[jumpPoint] = g
+                parents[jumpPoint] = cell
+                count += 1
+                heapq.heappush(openList, (g + abs(jumpPoint[0] - endRow) + abs(jumpPoint[1] - endCol), count,
+                                          jumpPoint, (dr, dc)))
+            if len(openList) > peakOpen:
+                peakOpen = len(openList)
+
+        self.searchStats = {'expanded': expanded, 'pushes': count + 1, 'peakOpen': peakOpen}
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert a binary or CSV grid into the sparse run-length format")
+    parser.add_argument('source', help="Binary or CSV grid")
+    parser.add_argument('target', help="Sparse grid to write")
+    args = parser.parse_args()
+
+    convertToSparse(args.source, args.target)
@@ -0,0 +1,37 @@
+import asyncio
+import json
+import os
+import unittest
+from server import PathServer
+
+GRID = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets', 'grids', 'grid1.txt')
+
+
+class PathServerTest(unittest.TestCase):
+    def setUp(self):
+        self.server = PathServer({'grid': ('grid', GRID)}, workers=2)
+        self.addCleanup(self.server.close)
+
+    def test_connection_closes_after_eof(self):
+        # The first search starts the workers, none of them may keep a copy of the client's socket
+        async def run():
+            self.server.start()
+            listener = await asyncio.start_server(self.server.handleConnection, '127.0.0.1', 0)
+            async with listener:
+                port = listener.sockets[0].getsockname()[1]
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                writer.write(json.dumps({'map': 'grid', 'id': 1}).encode() + b'\n')
+                writer.write_eof()
+                response = json.loads(await asyncio.wait_for(reader.readline(), 30))
+                rest = await asyncio.wait_for(reader.read(), 5)
+                writer.close()
+            return response, rest
+
+        response, rest = asyncio.run(run())
+        self.assertEqual(response['id'], 1)
+        self.assertIsNotNone(response['path'])
+        self.assertEqual(rest, b'')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,239 @@
+import argparse
+import heapq
+import struct
+import sys
+import time
+from collections import OrderedDict
+import numpy as np
+import mapfile
+from gridpathfinder import GridPathFinder
+from mazepathfinder import MazePathFinder
+from moves import MASK_STEPS
+from node import Node
+from searchstats import SearchResult
+
+# Tiled map layout: a fixed 36 byte header, then every tileSize x tileSize tile in row-major tile order
+# Tiles on the bottom and right edges are padded to full size, the padding is never read
+MAGIC = b'NEAT'
+VERSION = 1
+HEADER = struct.Struct('<4sBB2x7I')  # magic, version, kind, padding, height, width, tile size, start row/col, end row/col
+ENGINES = {'grid': GridPathFinder, 'maze': MazePathFinder}
+
+
+def isTiledMap(filePath):
+    with open(filePath, 'rb') as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def readHeader(filePath):
+    with open(filePath, 'rb') as file:
+        data = file.read(HEADER.size)
+    if len(data) < HEADER.size:
+        raise ValueError(f"File {filePath} is too short to be a tiled map.")
+
+    magic, version, kind, height, width, tileSize, startRow, startCol, endRow, endCol = HEADER.unpack(data)
+    if magic != MAGIC:
+        raise ValueError(f"File {filePath} is not a tiled map.")
+    if version != VERSION:
+        raise ValueError(f"Unsupported tiled map version {version} in {filePath}.")
+    if kind >= len(mapfile.KINDS) or tileSize == 0:
+        raise ValueError(f"Corrupt header in {filePath}.")
+
+    return {
+        'kind': mapfile.KINDS[kind],
+        'height': height,
+        'width': width,
+        'tileSize': tileSize,
+        'start': (startRow, startCol),
+        'end': (endRow, endCol),
+    }
+
+
+def saveTiled(filePath, kind, start, end, structure, tileSize=256):
+    # Writes one band of tile rows at a time, so a memory-mapped structure is never read in whole
+    height, width = structure.shape
+    with open(filePath, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, mapfile.KINDS.index(kind), height, width, tileSize, *start, *end))
+        for top in range(0, height, tileSize):
+            band = np.zeros((tileSize, -(-width // tileSize) * tileSize), dtype=np.uint8)
+            rows = structure[top:top + tileSize]
+            band[:rows.shape[0], :width] = rows
+            tiles = band.reshape(tileSize, -1, tileSize).swapaxes(0, 1)  # (tile, row, col)
+            file.write(np.ascontiguousarray(tiles).tobytes())
+
+
+def convertToTiled(source, target, kind=None, tileSize=256):
+    # Binary maps are read through their memory map, CSV maps need a kind
+    if mapfile.isBinaryMap(source):
+        header, structure = mapfile.loadBinary(source, mode='r')
+        kind, start, end = header['kind'], header['start'], header['end']
+    else:
+        if kind is None:
+            raise ValueError(f"A kind is needed to convert the CSV map {source}")
+        start, end, structure = mapfile.loadCsv(source)
+    saveTiled(target, kind, start, end, structure, tileSize)
+
+
+class TileCache:
+    # LRU of compiled move tiles over a tiled map file, tiles are compiled on first use from the memory map
+    def __init__(self, filePath, maxTiles=64):
+        header = readHeader(filePath)
+        self.kind = header['kind']
+        self.height, self.width = header['height'], header['width']
+        self.tileSize = header['tileSize']
+        self.start, self.end = header['start'], header['end']
+        self.tileRows = -(-self.height // self.tileSize)
+        self.tileCols = -(-self.width // self.tileSize)
+        self.cells = np.memmap(filePath, dtype=np.uint8, mode='r', offset=HEADER.size,
+                               shape=(self.tileRows, self.tileCols, self.tileSize, self.tileSize))
+        # compileMoves reads nothing from the instance, so a bare one of the engine is enough to call it
+        engine = ENGINES[self.kind]
+        self.compiler = engine.__new__(engine)
+        self.maxTiles = max(1, maxTiles)
+        self.tiles = OrderedDict()  # (tile row, tile col) -> compiled moves of the tile
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def readBlock(self, top, left, bottom, right):
+        # Cells of a rectangle of the map, which may cross tiles
+        size = self.tileSize
+        block = np.empty((bottom - top, right - left), dtype=np.uint8)
+        for tileRow in range(top // size, (bottom - 1) // size + 1):
+            for tileCol in range(left // size, (right - 1) // size + 1):
+                rowStart, rowEnd = max(top, tileRow * size), min(bottom, (tileRow + 1) * size)
+                colStart, colEnd = max(left, tileCol * size), min(right, (tileCol + 1) * size)
+                block[rowStart - top:rowEnd - top, colStart - left:colEnd - left] = \
+                    self.cells[tileRow, tileCol, rowStart - tileRow * size:rowEnd - tileRow * size,
+                               colStart - tileCol * size:colEnd - tileCol * size]
+        return block
+
+    def compileTile(self, tileRow, tileCol):
+        # The moves of a cell depend on its direct neighbours, so the tile is compiled with a one cell halo
+        size = self.tileSize
+        top, left = tileRow * size, tileCol * size
+        bottom, right = min(top + size, self.height), min(left + size, self.width)
+        haloTop, haloLeft = max(top - 1, 0), max(left - 1, 0)
+        block = self.readBlock(haloTop, haloLeft, min(bottom + 1, self.height), min(right + 1, self.width))
+        moves = self.compiler.compileMoves(block)
+        # Stored as size x size bytes, padded on edge tiles, so a lookup is one index into the tile
+        tile = np.zeros((size, size), dtype=np.uint8)
+        tile[:bottom - top, :right - left] = moves[top - haloTop:bottom - haloTop, left - haloLeft:right - haloLeft]
+        return tile.tobytes()
+
+    def tile(self, tileRow, tileCol):
+        key = (tileRow, tileCol)
+        moves = self.tiles.get(key)
+        if moves is not None:
+            self.hits += 1
+            self.tiles.move_to_end(key)
+            return moves
+        self.misses += 1
+        moves = self.tiles[key] = self.compileTile(tileRow, tileCol)
+        if len(self.tiles) > self.maxTiles:
+            self.tiles.popitem(last=False)
+            self.evictions += 1
+        return moves
+
+    def movesAt(self, row, col):
+        size = self.tileSize
+        return self.tile(row // size, col // size)[row % size * size + col % size]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'tileSize': self.tileSize, 'maxTiles': self.maxTiles, 'resident': len(self.tiles),
+                'residentBytes': sum(len(moves) for moves in self.tiles.values()), 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions,
+                'hitRate': self.hits / lookups if lookups else None}
+
+
+class TiledPathFinder:
+    # Searches a map too large for memory, only the tiles the search reaches are compiled and kept in the cache
+    # Search state is kept in dicts, so memory follows the cells explored rather than the size of the map
+    def __init__(self, filePath, maxTiles=64, maxBytes=None):
+        if maxBytes is not None:
+            tileSize = readHeader(filePath)['tileSize']
+            maxTiles = maxBytes // (tileSize * tileSize)
+        self.tiles = TileCache(filePath, maxTiles)
+        self.kind = self.tiles.kind
+        self.height, self.width = self.tiles.height, self.tiles.width
+        self.start, self.end = self.tiles.start, self.tiles.end
+        self.searchStats = None
+
+    def getNeighbour(self, node):
+        row, col = node.pos
+        return [Node(node, (row + dr, col + dc)) for dr, dc in MASK_STEPS[self.tiles.movesAt(row, col)]]
+
+    def findPath(self, start=None, end=None, weight=1):
+        start = tuple(self.start if start is None else start)
+        end = tuple(self.end if end is None else end)
+        for row, col in (start, end):
+            if not (0 <= row < self.height and 0 <= col < self.width):
+                raise ValueError(f"Cell {(row, col)} is outside the map")
+        return self.aStarSearch(start, end, weight)
+
+    def search(self, start=None, end=None, weight=1):
+        # findPath with what the search cost, as a SearchResult
+        self.searchStats = None
+        startTime = time.perf_counter()
+        path = self.findPath(start, end, weight)
+        return SearchResult(path, 'tiled', time.perf_counter() - startTime, self.searchStats)
+
+    def aStarSearch(self, start, end, weight=1):
+        endRow, endCol = end
+        movesAt = self.tiles.movesAt
+        bestG = {start: 0}
+        parents = {start: None}
+        closed = set()
+        openList = [(0, 0, start)]
+        count = 0
+        expanded = 0
+        peakOpen = 1
+        misses = self.tiles.misses
+
+        while openList:
+            current = heapq.heappop(openList)[2]
+            if current in closed:
+                continue  # Stale entry
+            closed.add(current)
+            expanded += 1
+            if current == end:
+                break
+
+            row, col = current
+            g = bestG[current] + 1
+            for dr, dc in MASK_STEPS[movesAt(row, col)]:
+                child = (row + dr, col + dc)
+                if child in closed or g >= bestG.get(child, sys.maxsize):
+                    continue
+                bestG[child] = g
+                parents[child] = current
+                count += 1
+                heapq.heappush(openList, (g + weight * (abs(child[0] - endRow) + abs(child[1] - endCol)), count, child))
+            if len(openList) > peakOpen:
+                peakOpen = len(openList)
+
+        self.searchStats = {'expanded': expanded, 'pushes': count + 1, 'peakOpen': peakOpen, 'bound': weight,
+                            'tileMisses': self.tiles.misses - misses}
+        if end not in closed:
+            return None
+        path = []
+        cell = end
+        while cell is not None:
+            path.append(cell)
+            cell = parents[cell]
+        return path[::-1]
+
+    def tileStats(self):
+        return self.tiles.stats()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert a binary or CSV map into the tiled map format")
+    parser.add_argument('source', help="Binary map, or CSV map with --kind")
+    parser.add_argument('target', help="Tiled map to write")
+    parser.add_argument('--kind', choices=mapfile.KINDS)
+    parser.add_argument('--tile-size', type=int, default=256)
+    args = parser.parse_args()
+
+    convertToTiled(args.source, args.target, args.kind, args.tile_size)